@@ -5,9 +5,13 @@ from CTFd.forms import Forms
 from CTFd.plugins.migrations import upgrade
 from CTFd.api import CTFd_API_v1
 
-from .forms import UserCreateForm, UserEditForm
+from . import events  # noqa: F401 registers the cache invalidation listeners
+from .cli import subscriptions_cli
+from .forms import UserCreateForm, UserEditForm, UserSearchForm
 from .challengeapi import challenges_namespace
 from .userapi import users_namespace
+from .tiers import SUBSCRIPTION_TIERS
+from .views import users_listing
 
 def load(app):
     '''
@@ -16,6 +20,9 @@ def load(app):
     upgrade() # required for upgrading tables
     app.db.create_all() # create from models if present
 
+    # expose the subscription tiers to the challenge templates
+    app.jinja_env.globals.update(subscription_tiers=SUBSCRIPTION_TIERS)
+
     # Overwrite the existing templates
     dir_path = Path(__file__).parent.resolve()
 
@@ -62,6 +69,14 @@ def load(app):
     # re-registers our own
     CTFd_API_v1.add_namespace(users_namespace, "/users")
 
+    # maintenance commands, e.g. `flask subscriptions rebuild-attempts`
+    app.cli.add_command(subscriptions_cli)
+
     # also link to our user creation and modification forms
     Forms.self.UserCreateForm = UserCreateForm
     Forms.self.UserEditForm = UserEditForm
+    Forms.self.UserSearchForm = UserSearchForm
+
+    # the blueprint is already registered, so the admin users listing is
+    # replaced by swapping its view function
+    app.view_functions['admin.users_listing'] = users_listing
@@ -0,0 +1,67 @@
+from CTFd.cache import cache
+from CTFd.models import Submissions, db
+
+from .caching import COUNTER_TIMEOUT, adjust_counter, bump_version, get_version
+
+
+def _attempts_key(account_id, challenge_id, version=None):
+    # Bumping the "attempts" version orphans every counter at once, including
+    # those of submissions that were removed by bulk deletes
+    if version is None:
+        version = get_version("attempts")
+    return "subscriptions_attempts_{}_{}_{}".format(version, account_id, challenge_id)
+
+
+def clear_attempt_counts():
+    bump_version("attempts")
+
+
+def get_attempt_count(account_id, challenge_id):
+    """
+    Number of submissions an account made on a challenge. Served from a cached
+    counter that is kept up to date on submission, seeding it on a miss.
+    """
+    key = _attempts_key(account_id, challenge_id)
+    count = cache.get(key)
+    if count is None:
+        count = Submissions.query.filter_by(
+            account_id=account_id, challenge_id=challenge_id
+        ).count()
+        # add() never overwrites a counter a concurrent submission created
+        # or incremented in the meantime
+        cache.add(key, count, timeout=COUNTER_TIMEOUT)
+    return count
+
+
+def adjust_attempt_count(account_id, challenge_id, delta):
+    adjust_counter(_attempts_key(account_id, challenge_id), delta)
+
+
+def rebuild_attempt_counts(chunk_size=1000):
+    """
+    Reconcile every counter with the submissions table. Counters are written
+    under a new version so that pairs without any submissions left are reset
+    as well. Returns the number of (account, challenge) pairs written.
+    """
+    clear_attempt_counts()
+    version = get_version("attempts")
+    counts_q = (
+        db.session.query(
+            Submissions.account_id, Submissions.challenge_id, db.func.count()
+        )
+        .group_by(Submissions.account_id, Submissions.challenge_id)
+        .yield_per(chunk_size)
+    )
+
+    total = 0
+    chunk = {}
+    for account_id, challenge_id, count in counts_q:
+        chunk[_attempts_key(account_id, challenge_id, version=version)] = count
+        if len(chunk) >= chunk_size:
+            cache.set_many(chunk, timeout=COUNTER_TIMEOUT)
+            total += len(chunk)
+            chunk = {}
+    if chunk:
+        cache.set_many(chunk, timeout=COUNTER_TIMEOUT)
+        total += len(chunk)
+    return total
@@ -0,0 +1,105 @@
+"""
+Times the file download URLs of the challenge detail endpoint for challenges
+with 1, 10 and 100 files.
+
+Every file of a challenge gets a signed token per user. utils.get_file_urls
+signs them once per user, team and challenge and then serves the URLs from an
+in-process cache. Both paths are reproduced here on a bare Flask app with the
+same "views.files" endpoint and itsdangerous signer CTFd uses, so the script
+runs without CTFd:
+
+    python benchmarks/file_urls.py [--repeat 200]
+"""
+import argparse
+import timeit
+from collections import namedtuple
+
+from flask import Blueprint, Flask, url_for
+from itsdangerous.url_safe import URLSafeTimedSerializer
+
+ChallengeFile = namedtuple("ChallengeFile", ["id", "location"])
+Challenge = namedtuple("Challenge", ["id", "files"])
+User = namedtuple("User", ["id"])
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "benchmark"
+    app.config["SERVER_NAME"] = "ctfd.local"
+    views = Blueprint("views", __name__)
+    views.add_url_rule("/files/<path:path>", "files", lambda path: path)
+    app.register_blueprint(views)
+    return app
+
+
+def serialize(data):
+    # Same signer as CTFd.utils.security.signing.serialize
+    return URLSafeTimedSerializer("benchmark").dumps(data)
+
+
+def sign_file_urls(chal, user, team_id):
+    # The per-request signing of the old detail endpoint
+    return tuple(
+        url_for(
+            "views.files",
+            path=f.location,
+            token=serialize({"user_id": user.id, "team_id": team_id, "file_id": f.id}),
+        )
+        for f in chal.files
+    )
+
+
+def cached_file_urls(cache, chal, user, team_id):
+    # Mirrors utils.get_file_urls, with a dict in place of the LRUCache
+    key = (user.id, team_id, chal.id, tuple((f.id, f.location) for f in chal.files))
+    urls = cache.get(key)
+    if urls is None:
+        urls = sign_file_urls(chal, user, team_id)
+        cache[key] = urls
+    return urls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    user = User(id=1)
+    app = create_app()
+    with app.app_context():
+        for count in (1, 10, 100):
+            chal = Challenge(
+                id=count,
+                files=tuple(
+                    ChallengeFile(id=i, location="{:032x}/file{}.zip".format(i, i))
+                    for i in range(count)
+                ),
+            )
+            cache = {}
+            assert cached_file_urls(cache, chal, user, None) == sign_file_urls(
+                chal, user, None
+            )
+
+            signed = min(
+                timeit.repeat(
+                    lambda: sign_file_urls(chal, user, None),
+                    number=1,
+                    repeat=args.repeat,
+                )
+            )
+            cached = min(
+                timeit.repeat(
+                    lambda: cached_file_urls(cache, chal, user, None),
+                    number=1,
+                    repeat=args.repeat,
+                )
+            )
+            print(
+                "{:>3} files   signed {:8.3f} ms   cached {:8.3f} ms   {:7.1f}x".format(
+                    count, signed * 1000, cached * 1000, signed / cached
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Times the prerequisite check of the challenge list at 5k challenges.
+
+The old list endpoint intersected every challenge's prerequisites with the set
+of existing challenge IDs on each request. The catalog now compiles that
+intersection once (utils._compile_prerequisites), so a request only runs a
+subset test (ChallengeListPayload.is_locked).
+
+Both strategies are reproduced here on plain Challenge tuples so that the
+script runs without CTFd:
+
+    python benchmarks/prerequisites.py [--challenges 5000] [--repeat 20]
+"""
+import argparse
+import timeit
+from collections import namedtuple
+
+# Same fields as utils.Challenge
+Challenge = namedtuple(
+    "Challenge",
+    [
+        "id",
+        "type",
+        "name",
+        "value",
+        "category",
+        "tags",
+        "requirements",
+        "description",
+        "state",
+        "max_attempts",
+        "prerequisites",
+        "anonymize",
+    ],
+)
+
+
+def compile_prerequisites(requirements, all_challenge_ids):
+    # Mirrors utils._compile_prerequisites
+    if not requirements:
+        return frozenset()
+    prerequisites = requirements.get("prerequisites", [])
+    return frozenset(prerequisites).intersection(all_challenge_ids)
+
+
+def build_challenges(count):
+    """
+    Challenges form chains of ten, each requiring the two before it. Every
+    tenth prerequisite points at a deleted challenge.
+    """
+    all_challenge_ids = frozenset(range(1, count + 1))
+    challenges = []
+    for i in range(1, count + 1):
+        chain = (i - 1) // 10
+        prerequisites = [p for p in (i - 1, i - 2) if p > 0 and (p - 1) // 10 == chain]
+        if i % 10 == 0:
+            prerequisites.append(count + i)
+        requirements = {"prerequisites": prerequisites} if prerequisites else None
+        challenges.append(
+            Challenge(
+                id=i,
+                type="standard",
+                name="challenge {}".format(i),
+                value=100,
+                category="bench",
+                tags=(),
+                requirements=requirements,
+                description="",
+                state="visible",
+                max_attempts=0,
+                prerequisites=compile_prerequisites(requirements, all_challenge_ids),
+                anonymize=False,
+            )
+        )
+    return challenges, all_challenge_ids
+
+
+def locked_inline(challenges, all_challenge_ids, user_solves):
+    # The per-request check of the old list endpoint
+    locked = 0
+    for challenge in challenges:
+        if challenge.requirements:
+            requirements = challenge.requirements.get("prerequisites", [])
+            prereqs = set(requirements).intersection(all_challenge_ids)
+            if not user_solves >= prereqs:
+                locked += 1
+    return locked
+
+
+def locked_compiled(challenges, user_solves):
+    # ChallengeListPayload.is_locked for a non-admin
+    locked = 0
+    for challenge in challenges:
+        if challenge.prerequisites and not challenge.prerequisites.issubset(
+            user_solves
+        ):
+            locked += 1
+    return locked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--challenges", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    challenges, all_challenge_ids = build_challenges(args.challenges)
+    for label, user_solves in (
+        ("no solves", set()),
+        ("half solved", set(range(1, args.challenges // 2 + 1))),
+        ("all solved", set(all_challenge_ids)),
+    ):
+        assert locked_inline(
+            challenges, all_challenge_ids, user_solves
+        ) == locked_compiled(challenges, user_solves)
+
+        inline = min(
+            timeit.repeat(
+                lambda: locked_inline(challenges, all_challenge_ids, user_solves),
+                number=1,
+                repeat=args.repeat,
+            )
+        )
+        compiled = min(
+            timeit.repeat(
+                lambda: locked_compiled(challenges, user_solves),
+                number=1,
+                repeat=args.repeat,
+            )
+        )
+        print(
+            "{:<12} inline {:8.3f} ms   issubset {:8.3f} ms   {:5.1f}x".format(
+                label, inline * 1000, compiled * 1000, inline / compiled
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import base64
+import hashlib
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import RLock
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from CTFd.cache import cache
+
+_missing = object()
+
+
+class LRUCache(object):
+    """
+    Small thread-safe in-process cache with least-recently-used eviction and an
+    optional per-entry timeout in seconds
+    """
+
+    def __init__(self, maxsize=128, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _missing)
+            if entry is _missing:
+                return default
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.timeout if self.timeout else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _version_key(name):
+    return "subscriptions_version_{}".format(name)
+
+
+def get_versions(*names):
+    """
+    Returns the current value of the named shared version counters.
+    Counters live in the CTFd cache so every worker sees the same values.
+    """
+    keys = [_version_key(name) for name in names]
+    versions = list(cache.get_many(*keys))
+    for i, version in enumerate(versions):
+        if version is None:
+            # Seed new or evicted counters from the clock so that they never
+            # rewind to a version an existing snapshot was built for
+            cache.add(keys[i], time.time_ns(), timeout=0)
+            versions[i] = cache.get(keys[i])
+    return tuple(versions)
+
+
+def get_version(name):
+    return get_versions(name)[0]
+
+
+def bump_version(name):
+    get_version(name)
+    return cache.inc(_version_key(name))
+
+
+# Cached counters are reseeded from the database at most this often, which
+# also bounds any drift from a seed racing a concurrent update
+COUNTER_TIMEOUT = 3600
+
+
+def adjust_counter(key, delta):
+    """
+    Add delta to a cached counter with a single atomic inc(). Counters that
+    are not cached are seeded on their next read instead, so when the inc()
+    created the key (it now holds just delta) the key is dropped again. That
+    may also drop a live counter that went from 0 to delta, which only costs
+    a reseed.
+    """
+    if delta and cache.inc(key, delta) == delta:
+        cache.delete(key)
+
+
+def versioned(*names, maxsize=32, timeout=None):
+    """
+    Memoizes a function in the current process, keyed on its arguments and on
+    the named version counters. Bumping a counter from any worker makes every
+    worker rebuild on its next call instead of waiting for a timeout.
+    """
+
+    def decorator(f):
+        snapshots = LRUCache(maxsize=maxsize, timeout=timeout)
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = (get_versions(*names), args, tuple(sorted(kwargs.items())))
+            value = snapshots.get(key, _missing)
+            if value is _missing:
+                value = f(*args, **kwargs)
+                snapshots.set(key, value)
+            return value
+
+        wrapper.snapshots = snapshots
+        return wrapper
+
+    return decorator
+
+
+def _memoized_keys(lookup, user_ids):
+    """
+    Same keys as lookup.make_cache_key(lookup.uncached, user_id=...) for every
+    user. make_cache_key() reads the function's memoize version from the cache
+    on each call, here it is read once and the per-user keys are hashed locally
+    the way flask-caching does.
+    """
+    f = lookup.uncached
+    fname, version = cache._memoize_version(f)
+    keys = []
+    for user_id in user_ids:
+        args, kwargs = cache._memoize_kwargs_to_args(f, user_id=user_id)
+        digest = hashlib.md5(
+            "{0}{1}{2}".format(fname, args, kwargs).encode("utf-8")
+        ).digest()
+        keys.append(base64.b64encode(digest)[:16].decode("utf-8") + version)
+    return keys
+
+
+# Whether _memoized_keys() agrees with make_cache_key() for a lookup, checked
+# once per process. flask-caching upgrades or settings such as
+# CACHE_SOURCE_CHECK change the keys, and then the public API is used instead.
+_local_keys_match = {}
+
+
+def _user_cache_keys(lookup, user_ids):
+    matches = _local_keys_match.get(lookup)
+    if matches is None:
+        user_id = user_ids[0]
+        try:
+            matches = _memoized_keys(lookup, [user_id]) == [
+                lookup.make_cache_key(lookup.uncached, user_id=user_id)
+            ]
+        except (AttributeError, TypeError, ValueError):
+            matches = False
+        _local_keys_match[lookup] = matches
+
+    if matches:
+        return _memoized_keys(lookup, user_ids)
+    return [
+        lookup.make_cache_key(lookup.uncached, user_id=user_id)
+        for user_id in user_ids
+    ]
+
+
+def clear_user_sessions(user_ids):
+    """
+    Batched version of CTFd's clear_user_session(). Every per-user lookup costs
+    one cache read for its version (unless its keys have to fall back to
+    make_cache_key()), after which all keys are removed with one delete_many().
+    """
+    from CTFd.utils import user as user_utils
+
+    from .userutils import get_user_subscription_level
+
+    lookups = [
+        getattr(user_utils, name)
+        for name in (
+            "get_user_attrs",
+            "get_user_place",
+            "get_user_score",
+            "get_user_recent_ips",
+        )
+        if hasattr(user_utils, name)
+    ]
+    lookups.append(get_user_subscription_level)
+
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    keys = [key for lookup in lookups for key in _user_cache_keys(lookup, user_ids)]
+    cache.delete_many(*keys)
+
+
+def bump_version_on_commit(session, *names):
+    """
+    Bump the named version counters once the session's transaction commits.
+    Bumping at flush time would let another worker rebuild from the
+    uncommitted state and cache it under the new version.
+    """
+    if session is None:
+        return
+    session.info.setdefault("subscriptions_versions", set()).update(names)
+
+
+def call_on_commit(session, callback, *args):
+    """
+    Run a cache update once the session's transaction commits. Callbacks are
+    dropped if the transaction is rolled back.
+    """
+    if session is None:
+        return
+    session.info.setdefault("subscriptions_callbacks", []).append((callback, args))
+
+
+@event.listens_for(Session, "after_commit")
+def _run_pending_updates(session):
+    for name in session.info.pop("subscriptions_versions", ()):
+        bump_version(name)
+    for callback, args in session.info.pop("subscriptions_callbacks", ()):
+        callback(*args)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_updates(session):
+    session.info.pop("subscriptions_versions", None)
+    session.info.pop("subscriptions_callbacks", None)
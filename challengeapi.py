@@ -1,8 +1,7 @@
 from typing import List  # noqa: I001
 
-from flask import abort, render_template, request, url_for
+from flask import Response, abort, request
 from flask_restx import Namespace, Resource
-from sqlalchemy.sql import and_
 
 from CTFd.api.v1.helpers.request import validate_args
 from CTFd.api.v1.helpers.schemas import sqlalchemy_to_pydantic
@@ -16,7 +15,7 @@ from CTFd.exceptions.challenges import (
 from CTFd.models import ChallengeFiles as ChallengeFilesModel
 from CTFd.models import Challenges
 from CTFd.models import ChallengeTopics as ChallengeTopicsModel
-from CTFd.models import Fails, Flags, Hints, HintUnlocks, Solves, Submissions, Tags, db
+from CTFd.models import Fails, Flags, Tags, db
 from CTFd.plugins.challenges import CHALLENGE_CLASSES, get_chal_class
 from CTFd.schemas.challenges import ChallengeSchema
 from CTFd.schemas.tags import TagSchema
@@ -40,7 +39,6 @@ from CTFd.utils.decorators import (
 from CTFd.utils.decorators.visibility import (
     check_challenge_visibility,
 )
-from CTFd.utils.security.signing import serialize
 from CTFd.utils.user import (
     authed,
     get_current_team,
@@ -50,7 +48,22 @@ from CTFd.utils.user import (
     is_admin,
 )
 
-from .utils import get_all_challenges
+from .attempts import get_attempt_count
+from .tiers import SUBSCRIPTION_TIERS
+from .utils import (
+    catalog_key,
+    challenge_list_etag,
+    clear_challenge_catalog,
+    clear_challenge_ids,
+    filter_challenges,
+    get_all_challenge_ids,
+    get_challenge_list_payload,
+    get_file_urls,
+    get_unlocked_hints,
+    load_challenge,
+    render_challenge_view,
+)
+from .userutils import get_user_subscription_level
 
 challenges_namespace = Namespace(
     "challenges", description="Endpoint to retrieve Challenges"
@@ -143,9 +156,10 @@ class ChallengeList(Resource):
 
         # Get list of solve_ids for current user
         if authed():
-            user = get_current_user()
+            user = get_current_user_attrs()
             user_solves = get_solve_ids_for_user_id(user_id=user.id)
-            user_subscription = user.subscription_level
+            # UserAttrs has no subscription_level, it is memoized separately
+            user_subscription = get_user_subscription_level(user_id=user.id)
         else:
             user = None
             user_solves = set()
@@ -162,67 +176,35 @@ class ChallengeList(Resource):
             # `None` for the solve count if visiblity checks fail
             solve_count_dfl = None
 
-        chal_q = get_all_challenges(admin=admin_view, field=field, q=q, sub=user_subscription, **query_args)
-
-        # Iterate through the list of challenges, adding to the object which
-        # will be JSONified back to the client
-        response = []
-        tag_schema = TagSchema(view="user", many=True)
-
-        # Gather all challenge IDs so that we can determine invalid challenge prereqs
-        all_challenge_ids = {
-            c.id for c in Challenges.query.with_entities(Challenges.id).all()
-        }
-        for challenge in chal_q:
-            if challenge.requirements:
-                requirements = challenge.requirements.get("prerequisites", [])
-                anonymize = challenge.requirements.get("anonymize")
-                prereqs = set(requirements).intersection(all_challenge_ids)
-                if user_solves >= prereqs or admin_view:
-                    pass
-                else:
-                    if anonymize:
-                        response.append(
-                            {
-                                "id": challenge.id,
-                                "type": "hidden",
-                                "name": "???",
-                                "value": 0,
-                                "solves": None,
-                                "solved_by_me": False,
-                                "category": "???",
-                                "tags": [],
-                                "template": "",
-                                "script": "",
-                            }
-                        )
-                    # Fallthrough to continue
-                    continue
-
-            try:
-                challenge_type = get_chal_class(challenge.type)
-            except KeyError:
-                # Challenge type does not exist. Fall through to next challenge.
-                continue
-
-            # Challenge passes all checks, add it to response
-            response.append(
-                {
-                    "id": challenge.id,
-                    "type": challenge_type.name,
-                    "name": challenge.name,
-                    "value": challenge.value,
-                    "solves": solve_counts.get(challenge.id, solve_count_dfl),
-                    "solved_by_me": challenge.id in user_solves,
-                    "category": challenge.category,
-                    "tags": tag_schema.dump(challenge.tags).data,
-                    "template": challenge_type.templates["view"],
-                    "script": challenge_type.scripts["view"],
-                }
+        key = catalog_key(admin=admin_view, sub=user_subscription)
+
+        # Polling clients get a 304 until something in their list changes
+        etag = challenge_list_etag(
+            key, solve_counts, solve_count_dfl, user_solves, request.query_string
+        )
+        if request.if_none_match.contains(etag):
+            db.session.close()
+            response = Response(status=304)
+        else:
+            # The list is assembled from the pre-encoded payload of the user's tier
+            payload = get_challenge_list_payload(**key)
+            challenges = payload.challenges
+            if q or query_args:
+                challenges = filter_challenges(
+                    challenges, field=field, q=q, **query_args
+                )
+
+            body = payload.render(
+                challenges, solve_counts, solve_count_dfl, user_solves
             )
 
-        db.session.close()
-        return {"success": True, "data": response}
+            db.session.close()
+            response = Response(body, mimetype="application/json")
+
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
 
     @admins_only
     @challenges_namespace.doc(
@@ -255,6 +237,8 @@ class ChallengeList(Resource):
         response = challenge_class.read(challenge)
 
         clear_challenges()
+        clear_challenge_catalog()
+        clear_challenge_ids()
 
         return {"success": True, "data": response}
 
@@ -275,26 +259,21 @@ class Challenge(Resource):
         },
     )
     def get(self, challenge_id):
-        user = get_current_user()
-        if is_admin():
-            chal = Challenges.query.filter(Challenges.id == challenge_id).first_or_404()
-        else:
-            # Get the challenge first
-            chal = Challenges.query.filter(
-                Challenges.id == challenge_id,
-                and_(Challenges.state != "hidden", Challenges.state != "locked"),
-            ).first_or_404()
-            
-            # Check subscription requirements using the new method
-            required_subscription = chal.get_subscription_required()
-            user_subscription = user.subscription_level if user else "freemium"
-            
-            # Check if user has access based on subscription level
-            if required_subscription == "premium" and user_subscription == "freemium":
-                abort(404)  # Challenge not accessible to freemium users
-            elif required_subscription == "all-in" and user_subscription in ["freemium", "premium"]:
-                abort(404)  # Challenge not accessible to non-all-in users
-            elif required_subscription == "beta" and user_subscription != "beta":
+        # Resolve the current user and team once for the whole request
+        user = get_current_user() if authed() else None
+        team = get_current_team() if user else None
+
+        # The challenge is loaded together with its files, tags and hints
+        chal = load_challenge(challenge_id, admin=is_admin())
+        if chal is None:
+            abort(404)
+
+        if is_admin() is False:
+            # Challenges above the user's subscription tier are not accessible
+            user_subscription = user.subscription_level if user else None
+            if not SUBSCRIPTION_TIERS.can_access(
+                user_subscription, chal.subscription_required
+            ):
                 abort(404)
 
         try:
@@ -305,28 +284,21 @@ class Challenge(Resource):
                 f"The underlying challenge type ({chal.type}) is not installed. This challenge can not be loaded.",
             )
 
+        # Get list of solve_ids for current user
+        if user:
+            user_solves = get_solve_ids_for_user_id(user_id=user.id)
+        else:
+            # We need to handle the case where a user is viewing challenges anonymously
+            user_solves = set()
+
         if chal.requirements:
             requirements = chal.requirements.get("prerequisites", [])
             anonymize = chal.requirements.get("anonymize")
             # Gather all challenge IDs so that we can determine invalid challenge prereqs
-            all_challenge_ids = {
-                c.id for c in Challenges.query.with_entities(Challenges.id).all()
-            }
+            all_challenge_ids = get_all_challenge_ids()
             if challenges_visible():
-                user = get_current_user()
-                if user:
-                    solve_ids = (
-                        Solves.query.with_entities(Solves.challenge_id)
-                        .filter_by(account_id=user.account_id)
-                        .order_by(Solves.challenge_id.asc())
-                        .all()
-                    )
-                else:
-                    # We need to handle the case where a user is viewing challenges anonymously
-                    solve_ids = []
-                solve_ids = {value for value, in solve_ids}
                 prereqs = set(requirements).intersection(all_challenge_ids)
-                if solve_ids >= prereqs or is_admin():
+                if user_solves >= prereqs or is_admin():
                     pass
                 else:
                     if anonymize:
@@ -354,11 +326,9 @@ class Challenge(Resource):
         ]
 
         unlocked_hints = set()
+        attempts = 0
         hints = []
-        if authed():
-            user = get_current_user()
-            team = get_current_team()
-
+        if user:
             # TODO: Convert this into a re-useable decorator
             if is_admin():
                 pass
@@ -366,26 +336,16 @@ class Challenge(Resource):
                 if config.is_teams_mode() and team is None:
                     abort(403)
 
-            unlocked_hints = {
-                u.target
-                for u in HintUnlocks.query.filter_by(
-                    type="hints", account_id=user.account_id
-                )
-            }
-            files = []
-            for f in chal.files:
-                token = {
-                    "user_id": user.id,
-                    "team_id": team.id if team else None,
-                    "file_id": f.id,
-                }
-                files.append(
-                    url_for("views.files", path=f.location, token=serialize(token))
-                )
-        else:
-            files = [url_for("views.files", path=f.location) for f in chal.files]
+            unlocked_hints = get_unlocked_hints(
+                account_id=user.account_id, challenge=chal
+            )
+            attempts = get_attempt_count(
+                account_id=user.account_id, challenge_id=chal.id
+            )
+
+        files = get_file_urls(chal, user=user, team=team)
 
-        for hint in Hints.query.filter_by(challenge_id=chal.id).all():
+        for hint in chal.hints:
             if hint.id in unlocked_hints or ctf_ended():
                 hints.append(
                     {"id": hint.id, "cost": hint.cost, "content": hint.content}
@@ -395,18 +355,10 @@ class Challenge(Resource):
 
         response = chal_class.read(challenge=chal)
 
-        # Get list of solve_ids for current user
-        if authed():
-            user = get_current_user()
-            user_solves = get_solve_ids_for_user_id(user_id=user.id)
-        else:
-            user_solves = []
-
         solves_count = get_solve_counts_for_challenges(challenge_id=chal.id)
         if solves_count:
-            challenge_id = chal.id
             solve_count = solves_count.get(chal.id)
-            solved_by_user = challenge_id in user_solves
+            solved_by_user = chal.id in user_solves
         else:
             solve_count, solved_by_user = 0, False
 
@@ -414,14 +366,6 @@ class Challenge(Resource):
         if scores_visible() is False or accounts_visible() is False:
             solve_count = None
 
-        if authed():
-            # Get current attempts for the user
-            attempts = Submissions.query.filter_by(
-                account_id=user.account_id, challenge_id=challenge_id
-            ).count()
-        else:
-            attempts = 0
-
         response["solves"] = solve_count
         response["solved_by_me"] = solved_by_user
         response["attempts"] = attempts
@@ -429,16 +373,15 @@ class Challenge(Resource):
         response["tags"] = tags
         response["hints"] = hints
 
-        response["view"] = render_template(
-            chal_class.templates["view"].lstrip("/"),
+        response["view"] = render_challenge_view(
+            chal_class,
+            chal,
             solves=solve_count,
             solved_by_me=solved_by_user,
             files=files,
             tags=tags,
-            hints=[Hints(**h) for h in hints],
-            max_attempts=chal.max_attempts,
+            hints=hints,
             attempts=attempts,
-            challenge=chal,
         )
 
         db.session.close()
@@ -476,6 +419,7 @@ class Challenge(Resource):
 
         clear_standings()
         clear_challenges()
+        clear_challenge_catalog()
 
         return {"success": True, "data": response}
 
@@ -491,6 +435,8 @@ class Challenge(Resource):
 
         clear_standings()
         clear_challenges()
+        clear_challenge_catalog()
+        clear_challenge_ids()
 
         return {"success": True}
 
@@ -0,0 +1,54 @@
+import click
+from flask.cli import AppGroup
+
+from .attempts import rebuild_attempt_counts
+from .imports import IMPORT_FORMATS, guess_format, import_subscriptions
+from .tiercounts import rebuild_tier_counts
+
+subscriptions_cli = AppGroup(
+    "subscriptions", help="Maintenance commands for the subscriptions plugin"
+)
+
+
+@subscriptions_cli.command("rebuild-attempts")
+@click.option("--chunk-size", default=1000, show_default=True)
+def rebuild_attempts(chunk_size):
+    """Reconcile the cached attempt counters with the submissions table"""
+    total = rebuild_attempt_counts(chunk_size=chunk_size)
+    click.echo("Rebuilt {} attempt counters".format(total))
+
+
+@subscriptions_cli.command("rebuild-tier-counts")
+def rebuild_tier_count_cache():
+    """Reconcile the cached subscription tier counters with the users table"""
+    counts = rebuild_tier_counts()
+    click.echo("Rebuilt {} tier counters".format(len(counts)))
+
+
+@subscriptions_cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(IMPORT_FORMATS))
+@click.option("--chunk-size", default=500, show_default=True)
+def import_entitlements(path, fmt, chunk_size):
+    """Apply subscription levels from a CSV or NDJSON billing export"""
+    fmt = fmt or guess_format(path)
+
+    def progress(report):
+        click.echo(
+            "{} rows processed, {} users updated, {} errors".format(
+                report.processed, report.updated, report.error_count
+            )
+        )
+
+    with open(path, newline="", encoding="utf-8-sig") as stream:
+        report = import_subscriptions(
+            stream, fmt=fmt, chunk_size=chunk_size, progress=progress
+        )
+
+    for error in report.errors:
+        click.echo("line {line}: {error}".format(**error), err=True)
+    if report.error_count > len(report.errors):
+        click.echo(
+            "... and {} more errors".format(report.error_count - len(report.errors)),
+            err=True,
+        )
@@ -0,0 +1,141 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+from CTFd.models import (
+    Awards,
+    Brackets,
+    Challenges,
+    Solves,
+    Submissions,
+    Tags,
+    UserFieldEntries,
+    UserFields,
+    Users,
+)
+
+from .attempts import adjust_attempt_count
+from .caching import bump_version_on_commit, call_on_commit
+from .tiercounts import adjust_tier_counts
+from .userutils import clear_user_subscription_level
+
+# Users columns the tier counters are grouped by
+TIER_COUNT_COLUMNS = ("subscription_level", "verified", "banned", "hidden")
+
+
+@event.listens_for(Challenges, "after_insert", propagate=True)
+@event.listens_for(Challenges, "after_update", propagate=True)
+@event.listens_for(Challenges, "after_delete", propagate=True)
+@event.listens_for(Tags, "after_insert", propagate=True)
+@event.listens_for(Tags, "after_update", propagate=True)
+@event.listens_for(Tags, "after_delete", propagate=True)
+def challenge_changed(mapper, connection, target):
+    """
+    Challenges and their tags can also be changed outside of this plugin's
+    endpoints (tag API, imports), so the catalog follows the ORM as well
+    """
+    bump_version_on_commit(object_session(target), "challenges")
+
+
+@event.listens_for(Challenges, "after_insert", propagate=True)
+@event.listens_for(Challenges, "after_delete", propagate=True)
+def challenge_added_or_removed(mapper, connection, target):
+    bump_version_on_commit(object_session(target), "challenge_ids")
+
+
+@event.listens_for(Submissions, "after_insert", propagate=True)
+def submission_added(mapper, connection, target):
+    call_on_commit(
+        object_session(target),
+        adjust_attempt_count,
+        target.account_id,
+        target.challenge_id,
+        1,
+    )
+
+
+@event.listens_for(Submissions, "after_delete", propagate=True)
+def submission_removed(mapper, connection, target):
+    call_on_commit(
+        object_session(target),
+        adjust_attempt_count,
+        target.account_id,
+        target.challenge_id,
+        -1,
+    )
+
+
+@event.listens_for(UserFields, "after_insert", propagate=True)
+@event.listens_for(UserFields, "after_update", propagate=True)
+@event.listens_for(UserFields, "after_delete", propagate=True)
+def user_field_changed(mapper, connection, target):
+    bump_version_on_commit(object_session(target), "user_fields")
+
+
+@event.listens_for(Brackets, "after_insert", propagate=True)
+@event.listens_for(Brackets, "after_update", propagate=True)
+@event.listens_for(Brackets, "after_delete", propagate=True)
+def bracket_changed(mapper, connection, target):
+    bump_version_on_commit(object_session(target), "brackets")
+
+
+@event.listens_for(Solves, "after_insert", propagate=True)
+@event.listens_for(Solves, "after_delete", propagate=True)
+@event.listens_for(Awards, "after_insert", propagate=True)
+@event.listens_for(Awards, "after_update", propagate=True)
+@event.listens_for(Awards, "after_delete", propagate=True)
+def score_changed(mapper, connection, target):
+    bump_version_on_commit(object_session(target), "standings")
+
+
+@event.listens_for(Users, "after_insert", propagate=True)
+@event.listens_for(Users, "after_update", propagate=True)
+@event.listens_for(Users, "after_delete", propagate=True)
+@event.listens_for(UserFieldEntries, "after_insert", propagate=True)
+@event.listens_for(UserFieldEntries, "after_update", propagate=True)
+@event.listens_for(UserFieldEntries, "after_delete", propagate=True)
+def user_changed(mapper, connection, target):
+    bump_version_on_commit(object_session(target), "users")
+
+
+@event.listens_for(Users, "after_update", propagate=True)
+def user_subscription_changed(mapper, connection, target):
+    if inspect(target).attrs.subscription_level.history.deleted:
+        call_on_commit(
+            object_session(target), clear_user_subscription_level, target.id
+        )
+
+
+def _tier_count_row(target, previous=False):
+    state = inspect(target)
+    values = []
+    for column in TIER_COUNT_COLUMNS:
+        history = state.attrs[column].history
+        if previous and history.deleted:
+            values.append(history.deleted[0])
+        else:
+            values.append(getattr(target, column))
+    return tuple(values) + (1,)
+
+
+@event.listens_for(Users, "after_insert", propagate=True)
+def user_added(mapper, connection, target):
+    call_on_commit(
+        object_session(target), adjust_tier_counts, [_tier_count_row(target)], 1
+    )
+
+
+@event.listens_for(Users, "after_update", propagate=True)
+def user_updated(mapper, connection, target):
+    previous = _tier_count_row(target, previous=True)
+    current = _tier_count_row(target)
+    if previous != current:
+        session = object_session(target)
+        call_on_commit(session, adjust_tier_counts, [previous], -1)
+        call_on_commit(session, adjust_tier_counts, [current], 1)
+
+
+@event.listens_for(Users, "after_delete", propagate=True)
+def user_removed(mapper, connection, target):
+    call_on_commit(
+        object_session(target), adjust_tier_counts, [_tier_count_row(target)], -1
+    )
@@ -7,46 +7,29 @@ from CTFd.constants.config import Configs
 from CTFd.constants.languages import SELECT_LANGUAGE_LIST
 from CTFd.forms import BaseForm
 from CTFd.forms.fields import SubmitField
-from CTFd.models import Brackets, UserFieldEntries, UserFields
+from CTFd.models import Brackets, UserFields
 from CTFd.utils.countries import SELECT_COUNTRIES_LIST
 
+from .caching import versioned
+from .tiers import SUBSCRIPTION_TIERS
 
-def build_custom_user_fields(
-    form_cls,
-    include_entries=False,
-    fields_kwargs=None,
-    field_entries_kwargs=None,
-    blacklisted_items=(),
-):
+
+def build_custom_user_fields(form, values=None):
     """
-    Function used to reinject values back into forms for accessing by themes
+    Function used to reinject values back into forms for accessing by themes.
+    The fields come from the custom_fields recorded on the form class by
+    attach_custom_user_fields, so binding a form does not query UserFields.
     """
-    if fields_kwargs is None:
-        fields_kwargs = {}
-    if field_entries_kwargs is None:
-        field_entries_kwargs = {}
-
     fields = []
-    new_fields = UserFields.query.filter_by(**fields_kwargs).all()
-    user_fields = {}
-
-    # Only include preexisting values if asked
-    if include_entries is True:
-        for f in UserFieldEntries.query.filter_by(**field_entries_kwargs).all():
-            user_fields[f.field_id] = f.value
-
-    for field in new_fields:
-        if field.name.lower() in blacklisted_items:
-            continue
-
-        form_field = getattr(form_cls, f"fields[{field.id}]")
+    for field_id, field_type in form.custom_fields:
+        form_field = getattr(form, f"fields[{field_id}]")
 
         # Add the field_type to the field so we know how to render it
-        form_field.field_type = field.field_type
+        form_field.field_type = field_type
 
         # Only include preexisting values if asked
-        if include_entries is True:
-            initial = user_fields.get(field.id, "")
+        if values is not None:
+            initial = values.get(field_id, "")
             form_field.data = initial
             if form_field.render_kw:
                 form_field.render_kw["data-initial"] = initial
@@ -81,6 +64,8 @@ def attach_custom_user_fields(form_cls, **kwargs):
 
         setattr(form_cls, f"fields[{field.id}]", input_field)
 
+    form_cls.custom_fields = [(field.id, field.field_type) for field in new_fields]
+
 
 def build_registration_code_field(form_cls):
     """
@@ -148,10 +133,20 @@ class UserSearchForm(BaseForm):
             ("affiliation", "Affiliation"),
             ("website", "Website"),
             ("ip", "IP Address"),
+            ("subscription_level", "Subscription"),
         ],
         default="name",
         validators=[InputRequired()],
     )
+    mode = SelectField(
+        "Match",
+        choices=[
+            ("prefix", "Starts with"),
+            ("exact", "Exact"),
+            ("contains", "Contains"),
+        ],
+        default="prefix",
+    )
     q = StringField("Parameter", validators=[InputRequired()])
     submit = SubmitField("Search")
 
@@ -182,7 +177,7 @@ class UserBaseForm(BaseForm):
     password = PasswordField("Password")
     website = StringField("Website")
     affiliation = StringField("Affiliation")
-    subscription_level = SelectField("Type", choices=[("freemium", "Freemium"), ("premium", "Premium"), ("all-in", "All-in"), ("beta", "Beta")])
+    subscription_level = SelectField("Type", choices=SUBSCRIPTION_TIERS.choices())
     country = SelectField("Country", choices=SELECT_COUNTRIES_LIST)
     type = SelectField("Type", choices=[("user", "User"), ("admin", "Admin")])
     verified = BooleanField("Verified")
@@ -191,17 +186,16 @@ class UserBaseForm(BaseForm):
     submit = SubmitField("Submit")
 
 
-def UserEditForm(*args, **kwargs):
+@versioned("user_fields", "brackets", maxsize=2)
+def get_user_edit_form_class():
     class _UserEditForm(UserBaseForm):
         pass
 
         @property
         def extra(self):
+            values = {entry.field_id: entry.value for entry in self.obj.field_entries}
             return build_custom_user_fields(
-                self,
-                include_entries=True,
-                fields_kwargs=None,
-                field_entries_kwargs={"user_id": self.obj.id},
+                self, values=values
             ) + build_user_bracket_field(self, value=self.obj.bracket_id)
 
         def __init__(self, *args, **kwargs):
@@ -216,20 +210,29 @@ def UserEditForm(*args, **kwargs):
     attach_custom_user_fields(_UserEditForm)
     attach_user_bracket_field(_UserEditForm)
 
-    return _UserEditForm(*args, **kwargs)
+    return _UserEditForm
 
 
-def UserCreateForm(*args, **kwargs):
+@versioned("user_fields", "brackets", maxsize=2)
+def get_user_create_form_class():
     class _UserCreateForm(UserBaseForm):
         notify = BooleanField("Email account credentials to user", default=True)
 
         @property
         def extra(self):
-            return build_custom_user_fields(
-                self, include_entries=False
-            ) + build_user_bracket_field(self)
+            return build_custom_user_fields(self) + build_user_bracket_field(self)
 
     attach_custom_user_fields(_UserCreateForm)
     attach_user_bracket_field(_UserCreateForm)
 
-    return _UserCreateForm(*args, **kwargs)
+    return _UserCreateForm
+
+
+# The form classes are only rebuilt when the custom user fields or the user
+# brackets change, instances just bind their own data
+def UserEditForm(*args, **kwargs):
+    return get_user_edit_form_class()(*args, **kwargs)
+
+
+def UserCreateForm(*args, **kwargs):
+    return get_user_create_form_class()(*args, **kwargs)
@@ -0,0 +1,191 @@
+import csv
+import json
+
+from sqlalchemy.sql import or_
+
+from CTFd.models import Users, db
+
+from .caching import clear_user_sessions
+from .tiercounts import group_tier_counts, move_tier_counts
+from .tiers import SUBSCRIPTION_TIERS
+from .userutils import clear_user_profiles
+
+IMPORT_FORMATS = ("csv", "ndjson")
+# Only the first errors are kept so that a bad export can't exhaust memory
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportReport(object):
+    def __init__(self):
+        self.processed = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self):
+        return {
+            "processed": self.processed,
+            "updated": self.updated,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+def guess_format(filename):
+    if filename and filename.lower().endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+def read_rows(stream, fmt="csv"):
+    """
+    Lazily yields (line number, row) pairs from a CSV file with a header row or
+    from newline delimited JSON. Rows that can't be decoded are yielded as None.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_num, row if isinstance(row, dict) else None
+
+
+def parse_row(row):
+    """
+    Returns ((column, value), subscription level) for a row, raising ValueError
+    with a readable message when the row is invalid
+    """
+    if row is None:
+        raise ValueError("Row could not be decoded")
+
+    # NDJSON values can be of any JSON type, CSV values are always strings
+    level = row.get("subscription_level")
+    if not isinstance(level, str) or level.strip() not in SUBSCRIPTION_TIERS:
+        raise ValueError("Invalid subscription level '{}'".format(level))
+    level = level.strip()
+
+    user_id = row.get("user_id")
+    email = row.get("email")
+    if user_id not in (None, ""):
+        if isinstance(user_id, bool) or not isinstance(user_id, (int, str)):
+            raise ValueError("Invalid user_id '{}'".format(user_id))
+        try:
+            return ("id", int(user_id)), level
+        except ValueError:
+            raise ValueError("Invalid user_id '{}'".format(user_id))
+    if email:
+        if not isinstance(email, str):
+            raise ValueError("Invalid email '{}'".format(email))
+        return ("email", email.strip()), level
+    raise ValueError("Row needs either an email or a user_id")
+
+
+def _match_key(column, value):
+    # Emails are matched case insensitively on every backend
+    if column == "email" and value is not None:
+        return column, value.lower()
+    return column, value
+
+
+def apply_chunk(rows, report):
+    """
+    Resolves a chunk of parsed rows to users with one query and applies them
+    with one UPDATE per subscription level
+    """
+    ids = [value for (column, value), _level, _line in rows if column == "id"]
+    emails = {
+        value.lower() for (column, value), _level, _line in rows if column == "email"
+    }
+    users = Users.query.with_entities(
+        Users.id, Users.email, Users.subscription_level
+    ).filter(or_(Users.id.in_(ids), db.func.lower(Users.email).in_(emails)))
+
+    by_key = {}
+    ambiguous = set()
+    current = {}
+    for user_id, email, level in users:
+        by_key[("id", user_id)] = user_id
+        if email is not None:
+            key = _match_key("email", email)
+            # Emails that only differ in case can't be told apart
+            if by_key.setdefault(key, user_id) != user_id:
+                ambiguous.add(key)
+        current[user_id] = level
+
+    # Later rows for the same user win
+    targets = {}
+    for key, level, line in rows:
+        if _match_key(*key) in ambiguous:
+            report.add_error(line, "Several users with {} '{}'".format(*key))
+            continue
+        user_id = by_key.get(_match_key(*key))
+        if user_id is None:
+            report.add_error(line, "No user with {} '{}'".format(*key))
+            continue
+        targets[user_id] = level
+
+    by_level = {}
+    for user_id, level in targets.items():
+        if current[user_id] != level:
+            by_level.setdefault(level, []).append(user_id)
+
+    changed_ids = []
+    moved = []
+    for level, user_ids in by_level.items():
+        users_q = Users.query.filter(Users.id.in_(user_ids))
+        moved.append((group_tier_counts(users_q), level))
+        users_q.update({Users.subscription_level: level}, synchronize_session=False)
+        changed_ids.extend(user_ids)
+    db.session.commit()
+
+    for tier_rows, level in moved:
+        move_tier_counts(tier_rows, level)
+    clear_user_sessions(changed_ids)
+    if changed_ids:
+        clear_user_profiles()
+    report.updated += len(changed_ids)
+
+
+def import_subscriptions(stream, fmt="csv", chunk_size=500, progress=None):
+    """
+    Streams subscription entitlements from a CSV or NDJSON file of
+    (email or user_id, subscription_level) rows and applies them in chunks.
+    Only one chunk of rows is held in memory at a time. `progress` is called
+    with the report after every chunk.
+    """
+    report = ImportReport()
+    chunk = []
+    for line, row in read_rows(stream, fmt=fmt):
+        report.processed += 1
+        try:
+            key, level = parse_row(row)
+        except ValueError as e:
+            report.add_error(line, str(e))
+            continue
+
+        chunk.append((key, level, line))
+        if len(chunk) >= chunk_size:
+            apply_chunk(chunk, report)
+            chunk = []
+            if progress:
+                progress(report)
+
+    if chunk:
+        apply_chunk(chunk, report)
+        if progress:
+            progress(report)
+
+    db.session.close()
+    return report
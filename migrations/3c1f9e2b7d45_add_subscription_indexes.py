@@ -0,0 +1,37 @@
+"""add subscription indexes
+
+Revision ID: 3c1f9e2b7d45
+Revises: a87f6484fe28
+Create Date: 2026-10-17 09:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f9e2b7d45'
+down_revision = 'a87f6484fe28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op):
+    # Matches the tier/state filter and the value, id ordering of the challenge listing
+    op.create_index(
+        'ix_challenges_subscription_state_value_id',
+        'challenges',
+        ['subscription_required', 'state', 'value', 'id'],
+        unique=False,
+    )
+    op.create_index(
+        'ix_users_subscription_level',
+        'users',
+        ['subscription_level'],
+        unique=False,
+    )
+
+
+def downgrade(op):
+    op.drop_index('ix_users_subscription_level', table_name='users')
+    op.drop_index('ix_challenges_subscription_state_value_id', table_name='challenges')
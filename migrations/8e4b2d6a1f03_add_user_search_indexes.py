@@ -0,0 +1,60 @@
+"""add user search indexes
+
+Revision ID: 8e4b2d6a1f03
+Revises: 3c1f9e2b7d45
+Create Date: 2026-10-17 14:03:52.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4b2d6a1f03'
+down_revision = '3c1f9e2b7d45'
+branch_labels = None
+depends_on = None
+
+# users.email is already covered by its unique constraint
+TRIGRAM_COLUMNS = ('name', 'email', 'affiliation')
+
+
+def has_pg_trgm(bind):
+    if bind.dialect.name != 'postgresql':
+        return False
+    available = bind.execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).first()
+    return available is not None
+
+
+def upgrade(op):
+    # Prefix and exact searches in the admin users listing
+    op.create_index('ix_users_name', 'users', ['name'], unique=False)
+    op.create_index('ix_users_affiliation', 'users', ['affiliation'], unique=False)
+    op.create_index('ix_tracking_ip', 'tracking', ['ip'], unique=False)
+
+    # Contains searches can only use an index where trigram indexes exist
+    bind = op.get_bind()
+    if has_pg_trgm(bind):
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for column in TRIGRAM_COLUMNS:
+            op.create_index(
+                'ix_users_{}_trgm'.format(column),
+                'users',
+                [column],
+                unique=False,
+                postgresql_using='gin',
+                postgresql_ops={column: 'gin_trgm_ops'},
+            )
+
+
+def downgrade(op):
+    bind = op.get_bind()
+    if has_pg_trgm(bind):
+        for column in TRIGRAM_COLUMNS:
+            op.execute('DROP INDEX IF EXISTS ix_users_{}_trgm'.format(column))
+
+    op.drop_index('ix_tracking_ip', table_name='tracking')
+    op.drop_index('ix_users_affiliation', table_name='users')
+    op.drop_index('ix_users_name', table_name='users')
@@ -0,0 +1,69 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from CTFd.models import Users, db
+from tests import helpers
+
+# Queries a cold challenge detail request may issue once the caches shared by
+# all challenges are warm: the user, the challenge with its files, tags and
+# hints, hint unlocks, the attempt counter seed and the solve count
+MAX_DETAIL_QUERIES = 12
+
+
+@contextmanager
+def count_queries(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def gen_subscription_challenge(size):
+    chal = helpers.gen_challenge(db, subscription_required="freemium")
+    for i in range(size):
+        helpers.gen_file(
+            db, challenge_id=chal.id, location="{}/file{}.txt".format(chal.id, i)
+        )
+        helpers.gen_tag(db, challenge_id=chal.id, value="tag{}".format(i))
+        helpers.gen_hint(db, challenge_id=chal.id, content="hint{}".format(i))
+    return chal.id
+
+
+def test_challenge_detail_query_count_is_bounded():
+    """
+    The detail endpoint issues the same number of queries however many files,
+    tags and hints a challenge has
+    """
+    app = helpers.create_ctfd()
+    with app.app_context():
+        warm_id = gen_subscription_challenge(1)
+        small_id = gen_subscription_challenge(1)
+        large_id = gen_subscription_challenge(10)
+
+        helpers.register_user(app)
+        user = Users.query.filter_by(name="user").first()
+        user.subscription_level = "freemium"
+        db.session.commit()
+
+        client = helpers.login_as_user(app)
+        # Warm the caches that are shared by every challenge
+        r = client.get("/api/v1/challenges/{}".format(warm_id))
+        assert r.status_code == 200
+
+        counts = []
+        for challenge_id in (small_id, large_id):
+            with count_queries(db.engine) as statements:
+                r = client.get("/api/v1/challenges/{}".format(challenge_id))
+            assert r.status_code == 200
+            counts.append(len(statements))
+
+        assert counts[0] == counts[1]
+        assert counts[1] <= MAX_DETAIL_QUERIES
+    helpers.destroy_ctfd(app)
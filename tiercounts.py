@@ -0,0 +1,118 @@
+from collections import Counter
+
+from CTFd.cache import cache
+from CTFd.models import Users, db
+
+from .caching import COUNTER_TIMEOUT, adjust_counter
+from .tiers import SUBSCRIPTION_TIERS
+
+# Flags each tier is broken down by, next to its total
+TIER_COUNT_FLAGS = ("verified", "banned", "hidden")
+
+
+def _tier_count_key(level, bucket):
+    return "subscriptions_tier_count_{}_{}".format(level, bucket)
+
+
+def _tier_count_keys():
+    return [
+        _tier_count_key(tier.name, bucket)
+        for tier in SUBSCRIPTION_TIERS
+        for bucket in ("total",) + TIER_COUNT_FLAGS
+    ]
+
+
+def _user_keys(level, verified, banned, hidden):
+    keys = [_tier_count_key(level, "total")]
+    for flag, value in zip(TIER_COUNT_FLAGS, (verified, banned, hidden)):
+        if value:
+            keys.append(_tier_count_key(level, flag))
+    return keys
+
+
+def group_tier_counts(query):
+    """
+    Groups a Users query into (subscription_level, verified, banned, hidden,
+    count) rows, the unit the counters are adjusted in
+    """
+    return (
+        query.with_entities(
+            Users.subscription_level,
+            Users.verified,
+            Users.banned,
+            Users.hidden,
+            db.func.count(Users.id),
+        )
+        .group_by(
+            Users.subscription_level, Users.verified, Users.banned, Users.hidden
+        )
+        .order_by(None)
+        .all()
+    )
+
+
+def rebuild_tier_counts():
+    """
+    Reseed every counter with one GROUP BY over the users table. Returns the
+    counters keyed like the cache.
+    """
+    counts = dict.fromkeys(_tier_count_keys(), 0)
+    for level, verified, banned, hidden, count in group_tier_counts(Users.query):
+        for key in _user_keys(level, verified, banned, hidden):
+            counts[key] = counts.get(key, 0) + count
+    cache.set_many(counts, timeout=COUNTER_TIMEOUT)
+    return counts
+
+
+def get_tier_counts():
+    """
+    Number of users per subscription tier, along with how many of them are
+    verified, banned and hidden. Served from cached counters that are kept up
+    to date as users change, seeding them on a miss.
+    """
+    keys = _tier_count_keys()
+    values = cache.get_many(*keys)
+    if any(value is None for value in values):
+        counts = rebuild_tier_counts()
+    else:
+        counts = dict(zip(keys, values))
+
+    return [
+        dict(
+            {
+                bucket: counts[_tier_count_key(tier.name, bucket)]
+                for bucket in ("total",) + TIER_COUNT_FLAGS
+            },
+            subscription_level=tier.name,
+            label=tier.label,
+        )
+        for tier in SUBSCRIPTION_TIERS
+    ]
+
+
+def adjust_tier_counts(rows, delta):
+    """
+    Apply grouped (level, verified, banned, hidden, count) rows to the counters
+    """
+    deltas = Counter()
+    for level, verified, banned, hidden, count in rows:
+        for key in _user_keys(level, verified, banned, hidden):
+            deltas[key] += count * delta
+
+    for key, value in deltas.items():
+        adjust_counter(key, value)
+
+
+def move_tier_counts(rows, level):
+    """
+    Move grouped rows of users to another subscription level, keeping their
+    verified, banned and hidden flags
+    """
+    adjust_tier_counts(rows, -1)
+    adjust_tier_counts(
+        [
+            (level, verified, banned, hidden, count)
+            for _level, verified, banned, hidden, count in rows
+        ],
+        1,
+    )
@@ -0,0 +1,69 @@
+from collections import namedtuple
+
+from marshmallow import ValidationError
+
+Tier = namedtuple("Tier", ["name", "label", "rank"])
+
+
+class TierRegistry:
+    """
+    Ordered registry of subscription tiers.
+
+    A subscription level may access every challenge whose required tier ranks
+    at or below its own. The allowed tier sets are precomputed whenever a tier
+    is registered so that access checks are a single set lookup.
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self._tiers = {}
+        self._allowed = {}
+
+    def register(self, name, label, rank):
+        self._tiers[name] = Tier(name=name, label=label, rank=rank)
+        ordered = list(self)
+        self._allowed = {
+            tier.name: frozenset(t.name for t in ordered if t.rank <= tier.rank)
+            for tier in ordered
+        }
+
+    def __iter__(self):
+        return iter(sorted(self._tiers.values(), key=lambda t: t.rank))
+
+    def __contains__(self, name):
+        return name in self._tiers
+
+    def get(self, name):
+        return self._tiers.get(name)
+
+    def resolve(self, level):
+        """
+        Returns the given subscription level if it is registered, otherwise
+        the default (lowest) tier
+        """
+        if level in self._tiers:
+            return level
+        return self.default
+
+    def allowed(self, level):
+        return self._allowed[self.resolve(level)]
+
+    def can_access(self, level, required):
+        return required in self.allowed(level)
+
+    def choices(self):
+        return [(tier.name, tier.label) for tier in self]
+
+
+SUBSCRIPTION_TIERS = TierRegistry(default="freemium")
+SUBSCRIPTION_TIERS.register("freemium", "Freemium", rank=0)
+SUBSCRIPTION_TIERS.register("premium", "Premium", rank=1)
+SUBSCRIPTION_TIERS.register("all-in", "All-in", rank=2)
+SUBSCRIPTION_TIERS.register("beta", "Beta", rank=3)
+
+
+def validate_subscription_level(level):
+    if level not in SUBSCRIPTION_TIERS:
+        raise ValidationError(
+            "Invalid subscription level", field_names=["subscription_level"]
+        )
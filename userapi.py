@@ -1,3 +1,4 @@
+import io
 from typing import List
 
 from flask import abort, request, session
@@ -11,19 +12,11 @@ from CTFd.api.v1.schemas import (
 )
 from CTFd.cache import clear_challenges, clear_standings, clear_user_session
 from CTFd.constants import RawEnum
-from CTFd.models import (
-    Awards,
-    Notifications,
-    Solves,
-    Submissions,
-    Tracking,
-    Unlocks,
-    Users,
-    db,
-)
+from CTFd.models import Users, db
 from CTFd.schemas.awards import AwardSchema
 from CTFd.schemas.submissions import SubmissionSchema
 from CTFd.utils.config import get_mail_provider
+from CTFd.utils.config.visibility import scores_visible
 from CTFd.utils.decorators import admins_only, authed_only, ratelimit
 from CTFd.utils.decorators.visibility import (
     check_account_visibility,
@@ -31,13 +24,38 @@ from CTFd.utils.decorators.visibility import (
 )
 from CTFd.utils.email import sendmail, user_created_notification
 from CTFd.utils.helpers.models import build_model_filters
+from CTFd.utils.humanize.numbers import ordinalize
 from CTFd.utils.security.auth import update_user
 from CTFd.utils.user import get_current_user, get_current_user_type, is_admin
 
 from . userschema import UserSchema
+from .imports import IMPORT_FORMATS, guess_format, import_subscriptions
+from .tiercounts import get_tier_counts
+from .tiers import SUBSCRIPTION_TIERS
+from .userutils import (
+    assign_subscription_level,
+    check_subscription_filter,
+    clear_user_standings,
+    get_user_profile,
+    get_user_standings_map,
+    purge_users,
+)
 
 users_namespace = Namespace("users", description="Endpoint to retrieve Users")
 
+# User fields shown on or used to filter the scoreboard
+STANDINGS_FIELDS = {
+    "name",
+    "affiliation",
+    "country",
+    "bracket_id",
+    "type",
+    "banned",
+    "hidden",
+}
+# Solves of banned and hidden users are left out of challenge solve counts
+SOLVE_COUNT_FIELDS = {"type", "banned", "hidden"}
+
 
 UserModel = sqlalchemy_to_pydantic(Users)
 TransientUserModel = sqlalchemy_to_pydantic(Users, exclude=["id"])
@@ -75,21 +93,38 @@ class UserPublic(Resource):
         },
     )
     def get(self, user_id):
-        user = Users.query.filter_by(id=user_id).first_or_404()
+        user_type = get_current_user_type(fallback="user")
+        try:
+            profile = get_user_profile(user_id, view=user_type)
+        except ValueError as e:
+            return {"success": False, "errors": e.args[0]}, 400
 
-        if (user.banned or user.hidden) and is_admin() is False:
+        if profile is None:
             abort(404)
 
-        user_type = get_current_user_type(fallback="user")
-        response = UserSchema(view=user_type).dump(user)
+        restricted, data = profile
+        if restricted and is_admin() is False:
+            abort(404)
 
-        if response.errors:
-            return {"success": False, "errors": response.errors}, 400
+        # Place and score come from the shared standings map instead of being
+        # computed per request, hidden like Users.place and Users.score when
+        # scores are not visible
+        if scores_visible() is False:
+            data = dict(data, place=None, score=None)
+            return {"success": True, "data": data}
 
-        response.data["place"] = user.place
-        response.data["score"] = user.score
+        standing = get_user_standings_map().get(user_id)
+        if standing:
+            place, score = standing
+            data = dict(data, place=ordinalize(place), score=score)
+        elif restricted:
+            # Banned and hidden users are not on the scoreboard
+            user = Users.query.filter_by(id=user_id).first_or_404()
+            data = dict(data, place=user.place, score=user.score)
+        else:
+            data = dict(data, place=None, score=0)
 
-        return {"success": True, "data": response.data}
+        return {"success": True, "data": data}
 
     @admins_only
     @users_namespace.doc(
@@ -116,11 +151,25 @@ class UserPublic(Resource):
                 400,
             )
 
+        # Remember the previous values so that only the caches affected by
+        # the fields that actually changed get invalidated
+        previous = {
+            field: getattr(user, field)
+            for field in data
+            if Users.__mapper__.has_property(field)
+        }
+
         schema = UserSchema(view="admin", instance=user, partial=True)
         response = schema.load(data)
         if response.errors:
             return {"success": False, "errors": response.errors}, 400
 
+        changed = {
+            field
+            for field, value in previous.items()
+            if getattr(user, field) != value
+        }
+
         # This generates the response first before actually changing the type
         # This avoids an error during User type changes where we change
         # the polymorphic identity resulting in an ObjectDeletedError
@@ -129,9 +178,14 @@ class UserPublic(Resource):
         db.session.commit()
         db.session.close()
 
+        # A subscription change only affects this user's own session, the
+        # shared per-tier challenge catalogs stay warm
         clear_user_session(user_id=user_id)
-        clear_standings()
-        clear_challenges()
+        if changed & STANDINGS_FIELDS:
+            clear_standings()
+            clear_user_standings()
+        if changed & SOLVE_COUNT_FIELDS:
+            clear_challenges()
 
         return {"success": True, "data": response.data}
 
@@ -148,18 +202,163 @@ class UserPublic(Resource):
                 400,
             )
 
-        Notifications.query.filter_by(user_id=user_id).delete()
-        Awards.query.filter_by(user_id=user_id).delete()
-        Unlocks.query.filter_by(user_id=user_id).delete()
-        Submissions.query.filter_by(user_id=user_id).delete()
-        Solves.query.filter_by(user_id=user_id).delete()
-        Tracking.query.filter_by(user_id=user_id).delete()
-        Users.query.filter_by(id=user_id).delete()
-        db.session.commit()
-        db.session.close()
-
-        clear_user_session(user_id=user_id)
-        clear_standings()
-        clear_challenges()
+        purge_users([user_id])
 
         return {"success": True}
+
+
+@users_namespace.route("/purge")
+class UserPurge(Resource):
+    @admins_only
+    @users_namespace.doc(
+        description="Endpoint to delete many User objects in one transaction",
+        responses={
+            200: ("Success", "APISimpleSuccessResponse"),
+            400: (
+                "An error occured processing the provided or stored data",
+                "APISimpleErrorResponse",
+            ),
+        },
+    )
+    def post(self):
+        data = request.get_json() or {}
+        user_ids = data.get("user_ids")
+        if not isinstance(user_ids, list) or not user_ids:
+            return (
+                {"success": False, "errors": {"user_ids": "Provide a list of user ids"}},
+                400,
+            )
+
+        try:
+            user_ids = [int(user_id) for user_id in user_ids]
+        except (TypeError, ValueError):
+            return (
+                {"success": False, "errors": {"user_ids": "User ids must be integers"}},
+                400,
+            )
+
+        # Admins should not be able to delete themselves
+        if session["id"] in user_ids:
+            return (
+                {"success": False, "errors": {"id": "You cannot delete yourself"}},
+                400,
+            )
+
+        deleted = purge_users(user_ids)
+
+        return {"success": True, "data": {"deleted": deleted}}
+
+
+@users_namespace.route("/subscriptions")
+class UserSubscriptions(Resource):
+    @admins_only
+    @users_namespace.doc(
+        description="Endpoint to move many users to a subscription level at once",
+        responses={
+            200: ("Success", "APISimpleSuccessResponse"),
+            400: (
+                "An error occured processing the provided or stored data",
+                "APISimpleErrorResponse",
+            ),
+        },
+    )
+    def patch(self):
+        data = request.get_json() or {}
+        level = data.get("subscription_level")
+        user_ids = data.get("user_ids")
+        filters = data.get("filter")
+
+        if not isinstance(level, str) or level not in SUBSCRIPTION_TIERS:
+            return (
+                {
+                    "success": False,
+                    "errors": {"subscription_level": "Invalid subscription level"},
+                },
+                400,
+            )
+
+        if (user_ids is None) == (filters is None):
+            return (
+                {
+                    "success": False,
+                    "errors": {"": "Provide either a list of user_ids or a filter"},
+                },
+                400,
+            )
+
+        if user_ids is not None:
+            if not isinstance(user_ids, list) or not user_ids:
+                return (
+                    {
+                        "success": False,
+                        "errors": {"user_ids": "Provide a list of user ids"},
+                    },
+                    400,
+                )
+            try:
+                user_ids = [int(user_id) for user_id in user_ids]
+            except (TypeError, ValueError):
+                return (
+                    {
+                        "success": False,
+                        "errors": {"user_ids": "User ids must be integers"},
+                    },
+                    400,
+                )
+
+        if filters is not None:
+            try:
+                check_subscription_filter(filters)
+            except ValueError as e:
+                return {"success": False, "errors": {"filter": str(e)}}, 400
+
+        updated = assign_subscription_level(level, user_ids=user_ids, filters=filters)
+
+        return {"success": True, "data": {"updated": updated}}
+
+
+@users_namespace.route("/subscriptions/counts")
+class UserSubscriptionCounts(Resource):
+    @admins_only
+    @users_namespace.doc(
+        description="Endpoint to get the number of users per subscription level",
+        responses={200: ("Success", "APISimpleSuccessResponse")},
+    )
+    def get(self):
+        return {"success": True, "data": get_tier_counts()}
+
+
+@users_namespace.route("/subscriptions/import")
+class UserSubscriptionsImport(Resource):
+    @admins_only
+    @users_namespace.doc(
+        description="Endpoint to apply subscription levels from a CSV or NDJSON export",
+        responses={
+            200: ("Success", "APISimpleSuccessResponse"),
+            400: (
+                "An error occured processing the provided or stored data",
+                "APISimpleErrorResponse",
+            ),
+        },
+    )
+    def post(self):
+        upload = request.files.get("file")
+        if upload is None:
+            return (
+                {"success": False, "errors": {"file": "Provide a file to import"}},
+                400,
+            )
+
+        fmt = request.form.get("format") or guess_format(upload.filename)
+        if fmt not in IMPORT_FORMATS:
+            return (
+                {"success": False, "errors": {"format": "Unsupported format"}},
+                400,
+            )
+
+        # The upload is read line by line instead of being loaded into memory.
+        # utf-8-sig drops the BOM that spreadsheet exports often start with
+        stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        report = import_subscriptions(stream, fmt=fmt)
+
+        return {"success": True, "data": report.to_dict()}
@@ -1,9 +1,11 @@
+from flask import abort
 from marshmallow import ValidationError, post_dump, pre_load, validate
 from marshmallow.fields import Nested
 from marshmallow_sqlalchemy import field_for
 from sqlalchemy.orm import load_only
+from sqlalchemy.sql import or_
 
-from CTFd.models import Brackets, UserFieldEntries, UserFields, Users, ma
+from CTFd.models import Brackets, UserFieldEntries, UserFields, Users, db, ma
 from CTFd.schemas.fields import UserFieldEntriesSchema
 from CTFd.utils import get_config, string_types
 from CTFd.utils.crypto import verify_password
@@ -11,6 +13,9 @@ from CTFd.utils.email import check_email_is_whitelisted
 from CTFd.utils.user import get_current_user, is_admin
 from CTFd.utils.validators import validate_country_code, validate_language
 
+from .tiers import validate_subscription_level
+from .userutils import get_hidden_user_field_ids
+
 
 class UserSchema(ma.ModelSchema):
     class Meta:
@@ -50,7 +55,9 @@ class UserSchema(ma.ModelSchema):
             else True
         ],
     )
-    subscription_level = field_for(Users, "subscription_level")
+    subscription_level = field_for(
+        Users, "subscription_level", validate=[validate_subscription_level]
+    )
     language = field_for(Users, "language", validate=[validate_language])
     country = field_for(Users, "country", validate=[validate_country_code])
     password = field_for(Users, "password", required=True, allow_none=False)
@@ -60,25 +67,56 @@ class UserSchema(ma.ModelSchema):
     )
 
     @pre_load
-    def validate_name(self, data):
+    def validate_name_and_email(self, data):
+        """
+        Name and email uniqueness are checked against a single lookup of the
+        users holding either of them
+        """
         name = data.get("name")
-        if name is None:
+        email = data.get("email")
+        if name is None and email is None:
             return
-        name = name.strip()
 
-        existing_user = Users.query.filter_by(name=name).first()
+        # Let the database decide which column matched so that the checks
+        # follow its collation like separate lookups would
+        columns = []
+        conditions = []
+        if email is not None:
+            email = email.strip()
+            columns.append((Users.email == email).label("email_match"))
+            conditions.append(Users.email == email)
+        if name is not None:
+            name = name.strip()
+            columns.append((Users.name == name).label("name_match"))
+            conditions.append(Users.name == name)
+
+        existing_email_id = None
+        existing_name_id = None
+        for row in db.session.query(Users.id, *columns).filter(or_(*conditions)):
+            if email is not None and row.email_match and existing_email_id is None:
+                existing_email_id = row.id
+            if name is not None and row.name_match and existing_name_id is None:
+                existing_name_id = row.id
+
         current_user = get_current_user()
-        if is_admin():
+        admin = is_admin()
+        if email is not None:
+            self._check_email(data, email, existing_email_id, current_user, admin)
+        if name is not None:
+            self._check_name(data, name, existing_name_id, current_user, admin)
+
+    def _check_name(self, data, name, existing_id, current_user, admin):
+        if admin:
             user_id = data.get("id")
             if user_id:
-                if existing_user and existing_user.id != user_id:
+                if existing_id and existing_id != user_id:
                     raise ValidationError(
                         "User name has already been taken", field_names=["name"]
                     )
             else:
-                if existing_user:
+                if existing_id:
                     if current_user:
-                        if current_user.id != existing_user.id:
+                        if current_user.id != existing_id:
                             raise ValidationError(
                                 "User name has already been taken", field_names=["name"]
                             )
@@ -88,38 +126,30 @@ class UserSchema(ma.ModelSchema):
                         )
         else:
             if name == current_user.name:
-                return data
+                return
             else:
                 name_changes = get_config("name_changes", default=True)
                 if bool(name_changes) is False:
                     raise ValidationError(
                         "Name changes are disabled", field_names=["name"]
                     )
-                if existing_user:
+                if existing_id:
                     raise ValidationError(
                         "User name has already been taken", field_names=["name"]
                     )
 
-    @pre_load
-    def validate_email(self, data):
-        email = data.get("email")
-        if email is None:
-            return
-        email = email.strip()
-
-        existing_user = Users.query.filter_by(email=email).first()
-        current_user = get_current_user()
-        if is_admin():
+    def _check_email(self, data, email, existing_id, current_user, admin):
+        if admin:
             user_id = data.get("id")
             if user_id:
-                if existing_user and existing_user.id != user_id:
+                if existing_id and existing_id != user_id:
                     raise ValidationError(
                         "Email address has already been used", field_names=["email"]
                     )
             else:
-                if existing_user:
+                if existing_id:
                     if current_user:
-                        if current_user.id != existing_user.id:
+                        if current_user.id != existing_id:
                             raise ValidationError(
                                 "Email address has already been used",
                                 field_names=["email"],
@@ -130,7 +160,7 @@ class UserSchema(ma.ModelSchema):
                         )
         else:
             if email == current_user.email:
-                return data
+                return
             else:
                 confirm = data.get("confirm")
 
@@ -147,7 +177,7 @@ class UserSchema(ma.ModelSchema):
                         "Your previous password is incorrect", field_names=["confirm"]
                     )
 
-                if existing_user:
+                if existing_id:
                     raise ValidationError(
                         "Email address has already been used", field_names=["email"]
                     )
@@ -227,65 +257,58 @@ class UserSchema(ma.ModelSchema):
         """
         This validator is used to only allow users to update the field entry for their user.
         It's not possible to exclude it because without the PK Marshmallow cannot load the right instance
+
+        The submitted fields and the user's existing entries are each fetched
+        with one query, however many fields are submitted.
         """
         fields = data.get("fields")
         if fields is None:
             return
 
-        current_user = get_current_user()
-
-        if is_admin():
-            user_id = data.get("id")
-            if user_id:
-                target_user = Users.query.filter_by(id=data["id"]).first()
-            else:
-                target_user = current_user
-
+        admin = is_admin()
+        if admin:
             # We are editting an existing user
             if self.view == "admin" and self.instance:
                 target_user = self.instance
-                provided_ids = []
-                for f in fields:
-                    f.pop("id", None)
-                    field_id = f.get("field_id")
-
-                    # # Check that we have an existing field for this. May be unnecessary b/c the foriegn key should enforce
-                    field = UserFields.query.filter_by(id=field_id).first_or_404()
-
-                    # Get the existing field entry if one exists
-                    entry = UserFieldEntries.query.filter_by(
-                        field_id=field.id, user_id=target_user.id
-                    ).first()
-                    if entry:
-                        f["id"] = entry.id
-                        provided_ids.append(entry.id)
-
-                # Extremely dirty hack to prevent deleting previously provided data.
-                # This needs a better soln.
-                entries = (
-                    UserFieldEntries.query.options(load_only("id"))
-                    .filter_by(user_id=target_user.id)
-                    .all()
-                )
-                for entry in entries:
-                    if entry.id not in provided_ids:
-                        fields.append({"id": entry.id})
+            else:
+                return
         else:
-            provided_ids = []
-            for f in fields:
-                # Remove any existing set
-                f.pop("id", None)
-                field_id = f.get("field_id")
+            target_user = get_current_user()
+
+        # # Check that we have an existing field for this. May be unnecessary b/c the foriegn key should enforce
+        try:
+            field_ids = [int(f.get("field_id")) for f in fields]
+        except (TypeError, ValueError):
+            abort(404)
+        user_fields = {}
+        if field_ids:
+            user_fields = {
+                field.id: field
+                for field in UserFields.query.filter(UserFields.id.in_(field_ids))
+            }
+            if not user_fields.keys() >= set(field_ids):
+                abort(404)
+
+        # Get the existing field entries, keeping the first one per field
+        existing = (
+            UserFieldEntries.query.options(load_only("id", "field_id"))
+            .filter_by(user_id=target_user.id)
+            .order_by(UserFieldEntries.id)
+            .all()
+        )
+        entries = {}
+        for entry in existing:
+            entries.setdefault(entry.field_id, entry)
+
+        provided_ids = []
+        for f, field_id in zip(fields, field_ids):
+            # Remove any existing set
+            f.pop("id", None)
+            field = user_fields[field_id]
+            entry = entries.get(field.id)
+
+            if not admin:
                 value = f.get("value")
-
-                # # Check that we have an existing field for this. May be unnecessary b/c the foriegn key should enforce
-                field = UserFields.query.filter_by(id=field_id).first_or_404()
-
-                # Get the existing field entry if one exists
-                entry = UserFieldEntries.query.filter_by(
-                    field_id=field.id, user_id=current_user.id
-                ).first()
-
                 if field.required is True:
                     if isinstance(value, str):
                         if value.strip() == "":
@@ -300,20 +323,15 @@ class UserSchema(ma.ModelSchema):
                         field_names=["fields"],
                     )
 
-                if entry:
-                    f["id"] = entry.id
-                    provided_ids.append(entry.id)
+            if entry:
+                f["id"] = entry.id
+                provided_ids.append(entry.id)
 
-            # Extremely dirty hack to prevent deleting previously provided data.
-            # This needs a better soln.
-            entries = (
-                UserFieldEntries.query.options(load_only("id"))
-                .filter_by(user_id=current_user.id)
-                .all()
-            )
-            for entry in entries:
-                if entry.id not in provided_ids:
-                    fields.append({"id": entry.id})
+        # Extremely dirty hack to prevent deleting previously provided data.
+        # This needs a better soln.
+        for entry in existing:
+            if entry.id not in provided_ids:
+                fields.append({"id": entry.id})
 
     @post_dump
     def process_fields(self, data):
@@ -325,18 +343,12 @@ class UserSchema(ma.ModelSchema):
         Users (self) can see their edittable and public fields
         Public (user) can only see public fields
         """
-        # Gather all possible fields
-        removed_field_ids = []
-        fields = UserFields.query.all()
-
         # Select fields for removal based on current view and properties of the field
-        for field in fields:
-            if self.view == "user":
-                if field.public is False:
-                    removed_field_ids.append(field.id)
-            elif self.view == "self":
-                if field.editable is False and field.public is False:
-                    removed_field_ids.append(field.id)
+        removed_field_ids = frozenset()
+        if isinstance(self.view, string_types):
+            removed_field_ids = get_hidden_user_field_ids().get(
+                self.view, removed_field_ids
+            )
 
         # Rebuild fuilds
         fields = data.get("fields")
@@ -0,0 +1,227 @@
+from CTFd.cache import cache, clear_challenges, clear_standings
+from CTFd.models import (
+    Awards,
+    Notifications,
+    Solves,
+    Submissions,
+    Tracking,
+    Unlocks,
+    UserFields,
+    Users,
+    db,
+)
+
+from .attempts import clear_attempt_counts
+from .caching import bump_version, clear_user_sessions, get_versions, versioned
+from .tiercounts import adjust_tier_counts, group_tier_counts, move_tier_counts
+
+# Keeps IN (...) clauses below the bound parameter limits of every backend
+PURGE_CHUNK_SIZE = 500
+UPDATE_CHUNK_SIZE = 500
+
+# Columns a bulk subscription assignment can select users by
+SUBSCRIPTION_FILTER_FIELDS = (
+    "subscription_level",
+    "type",
+    "verified",
+    "hidden",
+    "banned",
+    "bracket_id",
+    "country",
+    "affiliation",
+)
+
+
+def check_subscription_filter(filters):
+    """
+    Raises ValueError unless filters is a non-empty mapping of
+    SUBSCRIPTION_FILTER_FIELDS to values of the matching column type
+    """
+    if not isinstance(filters, dict) or not filters:
+        raise ValueError("Provide a non-empty filter")
+
+    for field, value in filters.items():
+        if field not in SUBSCRIPTION_FILTER_FIELDS:
+            raise ValueError(
+                "Filters are limited to {}".format(
+                    ", ".join(SUBSCRIPTION_FILTER_FIELDS)
+                )
+            )
+
+        column = Users.__table__.c[field]
+        if value is None:
+            if column.nullable:
+                continue
+            raise ValueError("'{}' cannot be null".format(field))
+
+        python_type = column.type.python_type
+        # bool is a subclass of int, so it is never accepted for other types
+        if isinstance(value, bool) != (python_type is bool) or not isinstance(
+            value, python_type
+        ):
+            raise ValueError("'{}' must be a {}".format(field, python_type.__name__))
+
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def purge_users(user_ids):
+    """
+    Deletes users and everything attached to them in a single transaction
+    using set-based deletes. Returns the number of deleted users.
+    """
+    user_ids = sorted(set(user_ids))
+    deleted = 0
+    # Bulk deletes skip the ORM events, so the tier counters are adjusted here
+    tier_rows = []
+    for chunk in chunked(user_ids, PURGE_CHUNK_SIZE):
+        for model in (Notifications, Awards, Unlocks, Submissions, Solves, Tracking):
+            model.query.filter(model.user_id.in_(chunk)).delete(
+                synchronize_session=False
+            )
+        users_q = Users.query.filter(Users.id.in_(chunk))
+        tier_rows.extend(group_tier_counts(users_q))
+        deleted += users_q.delete(synchronize_session=False)
+    db.session.commit()
+    db.session.close()
+
+    adjust_tier_counts(tier_rows, -1)
+    # The purged submissions skipped the ORM events, and in teams mode they
+    # also counted towards their team's counters
+    clear_attempt_counts()
+    clear_user_sessions(user_ids)
+    clear_user_profiles()
+    clear_user_standings()
+    clear_standings()
+    clear_challenges()
+
+    return deleted
+
+
+def assign_subscription_level(level, user_ids=None, filters=None):
+    """
+    Moves the selected users to a subscription level with set-based UPDATEs.
+    Users are selected by ID or by equality filters on SUBSCRIPTION_FILTER_FIELDS.
+    Returns the number of users whose level changed.
+    """
+    query = Users.query.filter(Users.subscription_level != level)
+    if filters:
+        query = query.filter_by(**filters)
+
+    # Bulk updates skip the ORM events, so the tier counters are moved here
+    if user_ids is None:
+        # The IDs are only needed to clear the affected sessions afterwards
+        changed_ids = [user_id for user_id, in query.with_entities(Users.id)]
+        tier_rows = group_tier_counts(query)
+        query.update({Users.subscription_level: level}, synchronize_session=False)
+    else:
+        changed_ids = []
+        tier_rows = []
+        for chunk in chunked(sorted(set(user_ids)), UPDATE_CHUNK_SIZE):
+            chunk_query = query.filter(Users.id.in_(chunk))
+            changed_ids.extend(
+                user_id for user_id, in chunk_query.with_entities(Users.id)
+            )
+            tier_rows.extend(group_tier_counts(chunk_query))
+            chunk_query.update(
+                {Users.subscription_level: level}, synchronize_session=False
+            )
+    db.session.commit()
+    db.session.close()
+
+    move_tier_counts(tier_rows, level)
+    clear_user_sessions(changed_ids)
+    clear_user_profiles()
+
+    return len(changed_ids)
+
+
+@cache.memoize(timeout=300)
+def get_user_subscription_level(user_id):
+    """
+    Subscription level of a user, memoized like CTFd's get_user_attrs() which
+    does not include it
+    """
+    return (
+        db.session.query(Users.subscription_level).filter_by(id=user_id).scalar()
+    )
+
+
+def clear_user_subscription_level(user_id):
+    cache.delete_memoized(get_user_subscription_level, user_id)
+
+
+@versioned("user_fields", maxsize=2)
+def get_hidden_user_field_ids():
+    """
+    IDs of the custom user fields hidden from each UserSchema view. Public
+    viewers only see public fields, users see their public and editable ones.
+    """
+    hidden = {"user": set(), "self": set()}
+    for field in UserFields.query.all():
+        if field.public is False:
+            hidden["user"].add(field.id)
+            if field.editable is False:
+                hidden["self"].add(field.id)
+    return {view: frozenset(ids) for view, ids in hidden.items()}
+
+
+@versioned("standings", "challenges", maxsize=2, timeout=60)
+def get_user_standings_map():
+    """
+    Maps user IDs to their (place, score) on the public scoreboard. The map is
+    rebuilt whenever solves, awards, challenge values or scoreboard relevant
+    user fields change, and at least every minute to pick up scoring settings
+    such as the freeze time.
+
+    The standings are queried without CTFd's memoization. The "standings"
+    version is bumped on commit, before CTFd's endpoints call
+    clear_standings(), so the memoized result could still be the old one.
+    """
+    from CTFd.utils.scores import get_user_standings
+
+    standings = get_user_standings.uncached()
+    return {
+        standing.user_id: (place, int(standing.score))
+        for place, standing in enumerate(standings, start=1)
+    }
+
+
+def clear_user_standings():
+    bump_version("standings")
+
+
+# Profiles are only cached briefly since they are also keyed on versions
+PROFILE_TIMEOUT = 30
+
+
+def get_user_profile(user_id, view):
+    """
+    Returns (restricted, data) for a user's profile dumped with the given
+    UserSchema view, or None if the user does not exist. `restricted` is set
+    for banned and hidden users. Profiles are cached per user and view.
+    """
+    from .userschema import UserSchema
+
+    key = "subscriptions_profile_{}_{}_{}".format(
+        "_".join(str(v) for v in get_versions("users", "user_fields")), user_id, view
+    )
+    profile = cache.get(key)
+    if profile is None:
+        user = Users.query.filter_by(id=user_id).first()
+        if user is None:
+            return None
+
+        response = UserSchema(view=view).dump(user)
+        if response.errors:
+            raise ValueError(response.errors)
+
+        profile = (bool(user.banned or user.hidden), response.data)
+        cache.set(key, profile, timeout=PROFILE_TIMEOUT)
+    return profile
+
+
+def clear_user_profiles():
+    bump_version("users")
@@ -1,102 +1,89 @@
+import hashlib
+import json
 from collections import namedtuple
+
+from flask import render_template, url_for
+from flask_babel import get_locale
+from sqlalchemy.orm import selectinload
 from sqlalchemy.sql import and_
-from sqlalchemy.orm import joinedload
 from CTFd.cache import cache
-from CTFd.models import Challenges
+from CTFd.models import Challenges, Hints, HintUnlocks
+from CTFd.plugins.challenges import get_chal_class
+from CTFd.utils.config import ctf_theme
+from CTFd.utils.security.signing import serialize
 from CTFd.schemas.tags import TagSchema
-from CTFd.utils.helpers.models import build_model_filters
+
+from .caching import LRUCache, bump_version, get_version, get_versions, versioned
+from .tiers import SUBSCRIPTION_TIERS
 
 
 Challenge = namedtuple(
-    "Challenge", ["id", "type", "name", "value", "category", "tags", "requirements"]
+    "Challenge",
+    [
+        "id",
+        "type",
+        "name",
+        "value",
+        "category",
+        "tags",
+        "requirements",
+        "description",
+        "state",
+        "max_attempts",
+        "prerequisites",
+        "anonymize",
+    ],
 )
 
-@cache.memoize(timeout=60)
-def get_all_challenges(admin=False, field=None, q=None, sub=None, **query_args):
-    filters = build_model_filters(model=Challenges, query=q, field=field)
+# Columns the list endpoint allows free-text searches on
+SEARCH_FIELDS = ("name", "description", "category", "type", "state")
+
+
+def subscription_filter(sub):
+    """
+    Express the tiers a subscription level may see as a single predicate on
+    Challenges.subscription_required. Unknown levels fall back to the default tier.
+    """
+    allowed = SUBSCRIPTION_TIERS.allowed(sub)
+    return Challenges.subscription_required.in_(sorted(allowed))
+
+
+def _visible_challenges_query(admin=False, sub=None):
     chal_q = Challenges.query
 
-    if sub == "freemium":
-        # For freemium users, get challenges that are either:
-        # 1. Explicitly marked as freemium in subscription_required
-        # 2. Have a topic indicating freemium access
-        freemium_challenges = []
-        all_challenges = Challenges.query.filter(Challenges.state != "locked").all()
-        
-        for challenge in all_challenges:
-            if challenge.get_subscription_required() == "freemium":
-                freemium_challenges.append(challenge.id)
-        
-        chal_q = chal_q.filter(
-            and_(Challenges.id.in_(freemium_challenges), Challenges.state != "locked")
-        )
-    elif sub == "premium":
-        # For premium users, get challenges that are freemium OR premium
-        accessible_challenges = []
-        all_challenges = Challenges.query.filter(Challenges.state != "locked").all()
-        
-        for challenge in all_challenges:
-            subscription_req = challenge.get_subscription_required()
-            if subscription_req in ["freemium", "premium"]:
-                accessible_challenges.append(challenge.id)
-        
-        chal_q = chal_q.filter(
-            and_(Challenges.id.in_(accessible_challenges), Challenges.state != "locked")
-        )
-    elif sub == "all-in":
-        accessible_challenges = []
-        all_challenges = (
-            Challenges.query
-            .options(joinedload(Challenges.topics))
-            .filter(and_(Challenges.state != "hidden", Challenges.state != "locked"))
-            .all()
-        )
-        
-        for challenge in all_challenges:
-            subscription_req = challenge.get_subscription_required()
-            if subscription_req in ["freemium", "premium", "all-in"]:
-                accessible_challenges.append(challenge.id)
-        
-        chal_q = chal_q.filter(
-            and_(
-                Challenges.id.in_(accessible_challenges),
-                Challenges.state != "hidden",
-                Challenges.state != "locked"
-            )
-        )
-    elif sub == "beta":
-        # Test users can see everything (for testing purposes)
-        accessible_challenges = []
-        all_challenges = (
-            Challenges.query
-            .options(joinedload(Challenges.topics))
-            .filter(and_(Challenges.state != "hidden", Challenges.state != "locked"))
-            .all()
-        )
-        
-        for challenge in all_challenges:
-            subscription_req = challenge.get_subscription_required()
-            # Test users see freemium, premium, all-in, AND beta challenges
-            if subscription_req == "beta":
-                accessible_challenges.append(challenge.id)
-        
+    # Admins can see hidden and locked challenges of every tier in the admin view
+    if admin is False:
         chal_q = chal_q.filter(
             and_(
-                Challenges.id.in_(accessible_challenges),
+                subscription_filter(sub),
                 Challenges.state != "hidden",
-                Challenges.state != "locked"
+                Challenges.state != "locked",
             )
         )
-    
-    chal_q = (
-        chal_q.filter_by(**query_args)
-        .filter(*filters)
-        .order_by(Challenges.value, Challenges.id)
-    )
+    return chal_q
+
+
+def _compile_prerequisites(requirements, all_challenge_ids):
+    """
+    Prerequisites are pre-intersected with the existing challenge IDs so that
+    checking them for a user is a single subset test against their solves
+    """
+    if not requirements:
+        return frozenset()
+    prerequisites = requirements.get("prerequisites", [])
+    return frozenset(prerequisites).intersection(all_challenge_ids)
 
+
+def _build_challenges(chal_q):
     tag_schema = TagSchema(view="user", many=True)
+    all_challenge_ids = get_all_challenge_ids()
 
     results = []
+    # Tags are loaded in bulk and serialized once here, so neither the cold
+    # build nor the list endpoint touch them per challenge
+    chal_q = chal_q.options(selectinload(Challenges.tags)).order_by(
+        Challenges.value, Challenges.id
+    )
     for c in chal_q:
         ct = Challenge(
             id=c.id,
@@ -106,6 +93,307 @@ def get_all_challenges(admin=False, field=None, q=None, sub=None, **query_args):
             category=c.category,
             requirements=c.requirements,
             tags=tag_schema.dump(c.tags).data,
+            description=c.description,
+            state=c.state,
+            max_attempts=c.max_attempts,
+            prerequisites=_compile_prerequisites(c.requirements, all_challenge_ids),
+            anonymize=bool(c.requirements and c.requirements.get("anonymize")),
         )
         results.append(ct)
-    return results
+    return tuple(results)
+
+
+@versioned("challenges", "challenge_ids", maxsize=16)
+def get_challenge_catalog(admin=False, sub=None):
+    """
+    Unfiltered challenge listing for a single subscription tier (or the admin view).
+    The snapshot is built once and served until clear_challenge_catalog() is called.
+    """
+    return _build_challenges(_visible_challenges_query(admin=admin, sub=sub))
+
+
+def filter_challenges(challenges, field=None, q=None, **query_args):
+    """
+    Applies the list endpoint's search and filter arguments to a catalog snapshot.
+    Filtered variants are cheap to derive so they are not cached separately.
+    """
+    if query_args:
+        challenges = [
+            c
+            for c in challenges
+            if all(getattr(c, k) == v for k, v in query_args.items())
+        ]
+    if q and field in SEARCH_FIELDS:
+        # Mirrors the case-insensitive LIKE used by build_model_filters
+        needle = q.casefold()
+        challenges = [
+            c for c in challenges if needle in (getattr(c, field) or "").casefold()
+        ]
+    return tuple(challenges)
+
+
+class ChallengeListPayload(object):
+    """
+    Pre-encoded JSON for the challenge list of one catalog snapshot.
+
+    Only the solve count and the solved_by_me flag differ between users, so each
+    entry is stored as the encoded bytes around those two values and a response
+    body is assembled by joining them instead of building and encoding dicts.
+    """
+
+    def __init__(self, challenges, admin=False):
+        self.challenges = challenges
+        self.admin = admin
+        self._entries = {}
+        self._hidden = {}
+        self._base = (None, None)
+
+        for challenge in challenges:
+            if challenge.anonymize:
+                self._hidden[challenge.id] = json.dumps(
+                    {
+                        "id": challenge.id,
+                        "type": "hidden",
+                        "name": "???",
+                        "value": 0,
+                        "solves": None,
+                        "solved_by_me": False,
+                        "category": "???",
+                        "tags": [],
+                        "template": "",
+                        "script": "",
+                    }
+                ).encode()
+
+            try:
+                challenge_type = get_chal_class(challenge.type)
+            except KeyError:
+                # Challenge type does not exist. It is left out of the response.
+                continue
+
+            head = json.dumps(
+                {
+                    "id": challenge.id,
+                    "type": challenge_type.name,
+                    "name": challenge.name,
+                    "value": challenge.value,
+                }
+            )
+            tail = json.dumps(
+                {
+                    "category": challenge.category,
+                    "tags": challenge.tags,
+                    "template": challenge_type.templates["view"],
+                    "script": challenge_type.scripts["view"],
+                }
+            )
+            self._entries[challenge.id] = (
+                head[:-1].encode() + b', "solves": ',
+                b", " + tail[1:].encode(),
+            )
+
+    def is_locked(self, challenge, user_solves):
+        if self.admin or not challenge.prerequisites:
+            return False
+        return not challenge.prerequisites.issubset(user_solves)
+
+    def render(self, challenges, solve_counts, solve_count_dfl, user_solves):
+        # Users without solves all see the same body for the unfiltered list,
+        # so it is kept for as long as the solve counts do not change
+        base = challenges is self.challenges and not user_solves
+        if base:
+            counts = tuple(solve_counts.get(c.id, solve_count_dfl) for c in challenges)
+            cached_counts, cached_body = self._base
+            if cached_counts == counts:
+                return cached_body
+
+        parts = []
+        for challenge in challenges:
+            if self.is_locked(challenge, user_solves):
+                if challenge.anonymize:
+                    parts.append(self._hidden[challenge.id])
+                continue
+
+            entry = self._entries.get(challenge.id)
+            if entry is None:
+                continue
+
+            head, tail = entry
+            solves = solve_counts.get(challenge.id, solve_count_dfl)
+            parts.append(
+                b"".join(
+                    (
+                        head,
+                        b"null" if solves is None else str(solves).encode(),
+                        b', "solved_by_me": ',
+                        b"true" if challenge.id in user_solves else b"false",
+                        tail,
+                    )
+                )
+            )
+
+        body = b'{"success": true, "data": [' + b", ".join(parts) + b"]}\n"
+        if base:
+            self._base = (counts, body)
+        return body
+
+
+@versioned("challenges", "challenge_ids", maxsize=16)
+def get_challenge_list_payload(admin=False, sub=None):
+    return ChallengeListPayload(get_challenge_catalog(admin=admin, sub=sub), admin=admin)
+
+
+def challenge_list_etag(key, solve_counts, solve_count_dfl, user_solves, args=b""):
+    """
+    Strong ETag for a challenge list response. It covers everything the body is
+    built from: the catalog versions, the tier, the (visibility dependent) solve
+    counts, the user's solves and the request's filters.
+    """
+    state = (
+        get_versions("challenges", "challenge_ids"),
+        key["admin"],
+        key["sub"],
+        solve_count_dfl,
+        sorted(solve_counts.items()),
+        sorted(user_solves),
+        args,
+    )
+    return hashlib.sha1(repr(state).encode()).hexdigest()
+
+
+def catalog_key(admin=False, sub=None):
+    """
+    Normalizes the catalog arguments so that every unknown subscription level
+    shares the default tier's snapshot
+    """
+    if admin:
+        return {"admin": True, "sub": None}
+    return {"admin": False, "sub": SUBSCRIPTION_TIERS.resolve(sub)}
+
+
+def clear_challenge_catalog():
+    bump_version("challenges")
+
+
+@versioned("challenge_ids", maxsize=2)
+def get_all_challenge_ids():
+    """
+    Set of every challenge ID, used to ignore prerequisites that point at deleted
+    challenges. Workers keep their own copy for the current version and only
+    fall back to the shared cache (and then the database) when it changes.
+    """
+    key = "subscriptions_challenge_ids_{}".format(get_version("challenge_ids"))
+    challenge_ids = cache.get(key)
+    if challenge_ids is None:
+        challenge_ids = frozenset(
+            c.id for c in Challenges.query.with_entities(Challenges.id).all()
+        )
+        cache.set(key, challenge_ids, timeout=3600)
+    return challenge_ids
+
+
+def clear_challenge_ids():
+    bump_version("challenge_ids")
+
+
+def load_challenge(challenge_id, admin=False):
+    """
+    Loads a challenge for the detail endpoint with its files, tags and hints
+    eager-loaded, so rendering it issues no lazy loads
+    """
+    chal_q = Challenges.query.options(
+        selectinload(Challenges.files),
+        selectinload(Challenges.tags),
+        selectinload(Challenges.hints),
+    ).filter(Challenges.id == challenge_id)
+    if admin is False:
+        chal_q = chal_q.filter(
+            and_(Challenges.state != "hidden", Challenges.state != "locked")
+        )
+    return chal_q.first()
+
+
+def get_unlocked_hints(account_id, challenge):
+    """
+    Returns the IDs of the challenge's hints unlocked by an account
+    """
+    hint_ids = [hint.id for hint in challenge.hints]
+    if not hint_ids:
+        return set()
+    unlocks = HintUnlocks.query.with_entities(HintUnlocks.target).filter(
+        HintUnlocks.account_id == account_id, HintUnlocks.target.in_(hint_ids)
+    )
+    return {target for target, in unlocks}
+
+
+# Rendered challenge views, shared by every request with the same view state
+_rendered_views = LRUCache(maxsize=2048)
+
+
+def render_challenge_view(
+    chal_class, chal, solves, solved_by_me, files, tags, hints, attempts
+):
+    """
+    Renders a challenge's view template, reusing an earlier render when the
+    challenge version and the per-user state shown by the template match
+    """
+    key = (
+        chal.id,
+        get_version("challenges"),
+        ctf_theme(),
+        str(get_locale()),
+        solves,
+        solved_by_me,
+        attempts,
+        tuple(files),
+        tuple(tags),
+        tuple(tuple(sorted(hint.items())) for hint in hints),
+    )
+    view = _rendered_views.get(key)
+    if view is None:
+        view = render_template(
+            chal_class.templates["view"].lstrip("/"),
+            solves=solves,
+            solved_by_me=solved_by_me,
+            files=files,
+            tags=tags,
+            hints=[Hints(**h) for h in hints],
+            max_attempts=chal.max_attempts,
+            attempts=attempts,
+            challenge=chal,
+        )
+        _rendered_views.set(key, view)
+    return view
+
+
+# File tokens are accepted for an hour (see CTFd.views.files), so signed URLs
+# are reused for most of that window and still leave time to download
+FILE_URL_TIMEOUT = 3000
+_file_urls = LRUCache(maxsize=4096, timeout=FILE_URL_TIMEOUT)
+
+
+def get_file_urls(chal, user=None, team=None):
+    """
+    Download URLs for a challenge's files. For authed users every file gets a
+    signed token, which is done once per user, team and challenge and then
+    reused while the tokens are still valid.
+    """
+    if user is None:
+        return tuple(url_for("views.files", path=f.location) for f in chal.files)
+
+    team_id = team.id if team else None
+    key = (user.id, team_id, chal.id, tuple((f.id, f.location) for f in chal.files))
+    urls = _file_urls.get(key)
+    if urls is None:
+        urls = tuple(
+            url_for(
+                "views.files",
+                path=f.location,
+                token=serialize(
+                    {"user_id": user.id, "team_id": team_id, "file_id": f.id}
+                ),
+            )
+            for f in chal.files
+        )
+        _file_urls.set(key, urls)
+    return urls
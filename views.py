@@ -1,45 +1,147 @@
+import hashlib
+from collections import namedtuple
+
 from flask import render_template, request, url_for
-from CTFd.admin import admin
+from sqlalchemy import false
+from CTFd.cache import cache
 from CTFd.utils.decorators import admins_only
 from CTFd.models import Tracking, Users, db
 
-from sqlalchemy import func
+from .tiercounts import get_tier_counts
+
+# Columns the admin search can match on, anything else is ignored
+SEARCH_FIELDS = (
+    "name",
+    "id",
+    "email",
+    "affiliation",
+    "website",
+    "subscription_level",
+)
+SEARCH_MODES = ("prefix", "exact", "contains")
+
+PER_PAGE = 50
+# Totals are only shown for orientation, so they may lag behind for a minute
+COUNT_TIMEOUT = 60
+
+UserPage = namedtuple("UserPage", ["items", "total", "prev_cursor", "next_cursor"])
+
+
+def escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def match(column, q, mode):
+    """
+    Builds the search predicate for a column. Prefix and exact matches can use
+    the column's index, contains only can where a trigram index exists.
+    """
+    if mode == "exact":
+        return column == q
+    if mode == "contains":
+        return column.like("%{}%".format(escape_like(q)), escape="\\")
+    return column.like("{}%".format(escape_like(q)), escape="\\")
+
+
+def search_users(q, field, mode="prefix"):
+    users_q = Users.query
+    if not q:
+        return users_q
+
+    if field == "ip":
+        # Match tracked IPs in a subquery so every user is listed once
+        user_ids = db.session.query(Tracking.user_id).filter(
+            match(Tracking.ip, q, mode)
+        )
+        return users_q.filter(Users.id.in_(user_ids))
+
+    if field == "id":
+        try:
+            return users_q.filter(Users.id == int(q))
+        except ValueError:
+            return users_q.filter(false())
+
+    if field == "subscription_level":
+        return users_q.filter(Users.subscription_level == q)
+
+    if field in SEARCH_FIELDS:
+        return users_q.filter(match(getattr(Users, field), q, mode))
+    return users_q
+
+
+def count_users(users_q, q, field, mode):
+    digest = hashlib.sha1(repr((q, field, mode)).encode("utf-8")).hexdigest()
+    key = "subscriptions_user_count_{}".format(digest)
+    total = cache.get(key)
+    if total is None:
+        total = users_q.order_by(None).count()
+        cache.set(key, total, timeout=COUNT_TIMEOUT)
+    return total
+
+
+def paginate_users(users_q, after=None, before=None, per_page=PER_PAGE):
+    """
+    Keyset pagination on Users.id. Pages are selected with `id > after` or
+    `id < before` instead of an OFFSET, so every page costs the same.
+    """
+    if before is not None:
+        rows = (
+            users_q.filter(Users.id < before)
+            .order_by(Users.id.desc())
+            .limit(per_page + 1)
+            .all()
+        )
+        has_prev = len(rows) > per_page
+        has_next = True
+        items = list(reversed(rows[:per_page]))
+    else:
+        if after is not None:
+            users_q = users_q.filter(Users.id > after)
+        rows = users_q.order_by(Users.id.asc()).limit(per_page + 1).all()
+        has_prev = after is not None
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+
+    return (
+        items,
+        items[0].id if items and has_prev else None,
+        items[-1].id if items and has_next else None,
+    )
+
 
-@admin.route("/admin/users")
 @admins_only
 def users_listing():
     q = request.args.get("q")
     field = request.args.get("field")
-    page = abs(request.args.get("page", 1, type=int))
-    filters = []
-    users = []
-
-    if q:
-        # The field exists as an exposed column
-        if Users.__mapper__.has_property(field):
-            filters.append(getattr(Users, field).like("%{}%".format(q)))
-
-    if q and field == "ip":
-        users = (
-            Users.query.join(Tracking, Users.id == Tracking.user_id)
-            .filter(Tracking.ip.like("%{}%".format(q)))
-            .order_by(Users.id.asc())
-            .paginate(page=page, per_page=50, error_out=False)
-        )
-    else:
-        users = (
-            Users.query.filter(*filters)
-            .order_by(Users.id.asc())
-            .paginate(page=page, per_page=50, error_out=False)
-        )
+    mode = request.args.get("mode")
+    if mode not in SEARCH_MODES:
+        mode = "prefix"
+    after = request.args.get("after", type=int)
+    before = request.args.get("before", type=int)
+
+    users_q = search_users(q, field, mode)
+    items, prev_cursor, next_cursor = paginate_users(
+        users_q, after=after, before=before
+    )
+    users = UserPage(
+        items=items,
+        total=count_users(users_q, q, field, mode),
+        prev_cursor=prev_cursor,
+        next_cursor=next_cursor,
+    )
+
     args = dict(request.args)
-    args.pop("page", 1)
+    args.pop("after", None)
+    args.pop("before", None)
+    args.pop("page", None)
 
     return render_template(
         "admin/users/users.html",
         users=users,
-        prev_page=url_for(request.endpoint, page=users.prev_num, **args),
-        next_page=url_for(request.endpoint, page=users.next_num, **args),
+        prev_page=url_for(request.endpoint, before=prev_cursor, **args),
+        next_page=url_for(request.endpoint, after=next_cursor, **args),
         q=q,
         field=field,
+        mode=mode,
+        tier_counts=get_tier_counts(),
     )